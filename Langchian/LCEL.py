@@ -1,3 +1,188 @@
+# 响应缓存
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import messages_from_dict, messages_to_dict
+from langchain_core.runnables import Runnable, RunnableConfig
+from loguru import logger
+
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")  # memory / sqlite / redis
+LLM_CACHE_TTL = 24 * 3600                 # 缓存的回答多久过期（秒）
+LLM_CACHE_SIZE = 1000                     # 内存 LRU 最多保留多少条
+LLM_CACHE_PATH = "llm_cache.sqlite"       # SQLite 缓存文件
+LLM_CACHE_DISK_SIZE = 100_000             # SQLite 缓存最多保留多少条
+LLM_CACHE_REDIS_URL = "redis://localhost:6379"
+
+
+class MemoryCache:
+    """进程内 LRU 缓存，每条记录带过期时间"""
+
+    def __init__(self, max_entries: int = LLM_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (过期时间, 值)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class SQLiteCache:
+    """
+    SQLite 缓存，进程重启后仍然有效；并行链会从多个线程访问，统一加锁。
+    每次写入时删掉已过期的记录，超过 max_entries 条时删掉最早过期的，文件不会无限增长
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_DISK_SIZE):
+        self.max_entries = max_entries
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires ON llm_cache (expires_at)")
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl)
+            )
+            self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+
+class RedisCache:
+    """Redis 缓存，多个进程共享，过期交给 Redis 的 TTL"""
+
+    def __init__(self, url: str = LLM_CACHE_REDIS_URL, prefix: str = "llm_cache:"):
+        import redis
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(self.prefix + key)
+
+    def set(self, key: str, value: str, ttl: int):
+        self._client.set(self.prefix + key, value, ex=ttl)
+
+
+def make_cache(backend: str = LLM_CACHE_BACKEND):
+    """按名字创建缓存后端"""
+    if backend == "sqlite":
+        return SQLiteCache()
+    if backend == "redis":
+        return RedisCache()
+    return MemoryCache()
+
+
+class CachedChatModel(Runnable):
+    """
+    带响应缓存的聊天模型，可以直接替换链中的模型：chat_prompt | CachedChatModel(model) | parser
+
+    缓存 key 是 模型类型 + 模型参数（model、temperature 等）+ 渲染后的完整消息 的 sha256，
+    同样的提示词和参数第二次调用直接返回缓存的 AIMessage，不再请求模型。
+    默认只缓存 temperature 为 0 的确定性调用；temperature 非 0 或未设置（走模型自己的默认值）时
+    直接调用模型，除非显式传入 cache_sampled=True，接受重复提问时拿到与上次相同的回答。
+
+    Args:
+        model (BaseChatModel): 实际调用的模型，例如 ChatOllama(temperature=0)
+        cache: 缓存后端，MemoryCache / SQLiteCache / RedisCache，默认按 LLM_CACHE_BACKEND 创建
+        ttl (int): 缓存过期时间（秒）
+        cache_sampled (bool): temperature 非 0 时是否也走缓存
+    """
+
+    def __init__(self, model: BaseChatModel, cache=None, ttl: int = LLM_CACHE_TTL,
+                 cache_sampled: bool = False):
+        self.model = model
+        self.cache = cache if cache is not None else make_cache()
+        self.ttl = ttl
+        self.cache_sampled = cache_sampled
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._lock = threading.Lock()  # 并行链会从多个线程同时调用，计数要加锁
+
+    def _cacheable(self, **kwargs) -> bool:
+        temperature = kwargs.get("temperature", getattr(self.model, "temperature", None))
+        return self.cache_sampled or temperature == 0
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _key(self, input: Any, **kwargs) -> str:
+        # 只取可序列化的简单参数，callbacks、client 之类的对象不参与 key
+        params = {
+            name: value for name, value in self.model.model_dump().items()
+            if isinstance(value, (str, int, float, bool, list, dict)) and not name.startswith("_")
+        }
+        messages = self.model._convert_input(input).to_messages()
+        payload = json.dumps(
+            {"type": type(self.model).__name__, "params": params, "kwargs": kwargs,
+             "messages": messages_to_dict(messages)},
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any):
+        if not self._cacheable(**kwargs):
+            self._count("skipped")
+            return self.model.invoke(input, config, **kwargs)
+        key = self._key(input, **kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count("hits")
+            return messages_from_dict(json.loads(cached))[0]
+        self._count("misses")
+        result = self.model.invoke(input, config, **kwargs)
+        self.cache.set(key, json.dumps(messages_to_dict([result]), ensure_ascii=False), self.ttl)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "skipped": self.skipped,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+# 所有示例共用一个缓存后端
+llm_cache = make_cache()
+
 # 顺序链
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
@@ -14,8 +199,8 @@ chat_prompt = ChatPromptTemplate.from_messages([
 prompt = chat_prompt.invoke({"role": "AI助手", "question": "什么是LangChain"})
 logger.info(prompt)
 
-# 初始化Ollama聊天模型，指定使用qwen3:8b模型，关闭推理模式
-model = ChatOllama(model="qwen3:8b", reasoning=False)
+# 初始化Ollama聊天模型，指定使用qwen3:8b模型，关闭推理模式；外面包一层响应缓存，cache_sampled=True 表示同样的提问直接复用上次的回答
+model = CachedChatModel(ChatOllama(model="qwen3:8b", reasoning=False), cache=llm_cache, cache_sampled=True)
 
 # 调用模型获取原始响应并记录日志
 result = model.invoke(prompt)
@@ -38,15 +223,24 @@ chain = chat_prompt | model | parser
 result_chain = chain.invoke({"role": "AI助手", "question": "什么是LangChain"})
 logger.info(f"Chain执行结果:\n {result_chain}")
 logger.info(f"Chain执行结果类型: {type(result_chain)}")
+# 链里渲染出的提示词和上面单独调用时完全相同，这次直接命中缓存
+logger.info(f"响应缓存统计: {model.stats()}")
 
  
 # 分支链
+import re
+from typing import Dict, List
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableBranch
+from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_ollama import ChatOllama
 from loguru import logger
 
+try:
+    import ahocorasick  # pyahocorasick，可选；路由关键词很多时用自动机匹配
+except ImportError:
+    ahocorasick = None
+
 # 构建提示词
 english_prompt = ChatPromptTemplate.from_messages([
     ("system", "你是一个英语翻译专家，你叫小英"),
@@ -64,28 +258,95 @@ korean_prompt = ChatPromptTemplate.from_messages([
 ])
 
 
-def determine_language(inputs):
-    """判断语言种类"""
-    query = inputs["query"]
-    if "日语" in query:
-        return "japanese"
-    elif "韩语" in query:
-        return "korean"
-    else:
-        return "english"
-
-
-# 初始化Ollama聊天模型，指定使用qwen3:8b模型，关闭推理模式
-model = ChatOllama(model="qwen3:8b", reasoning=False)
+# 路由关键词：出现任意一个关键词就走对应分支，扩展语言或技能只需要加一行
+ROUTE_KEYWORDS = {
+    "japanese": ["日语", "日文"],
+    "korean": ["韩语", "韩文"],
+    "english": ["英语", "英文"],
+}
+DEFAULT_ROUTE = "english"
+
+
+class KeywordMatcher:
+    """
+    预编译的关键词匹配器：返回文本中最先出现的关键词对应的路由名
+
+    装有 pyahocorasick 时构建 Aho-Corasick 自动机，否则把所有关键词编译成一个正则，
+    两种方式都只扫描一遍文本，不随路由数量逐个判断
+
+    Args:
+        keywords (Dict[str, List[str]]): 路由名 -> 关键词列表
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]]):
+        self._routes = {word: route for route, words in keywords.items() for word in words}
+        # 长关键词优先，避免被它的前缀抢先匹配
+        words = sorted(self._routes, key=len, reverse=True)
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for word in words:
+                self._automaton.add_word(word, word)
+            self._automaton.make_automaton()
+        else:
+            self._automaton = None
+            self._pattern = re.compile("|".join(map(re.escape, words)))
+
+    def match(self, text: str):
+        if self._automaton is not None:
+            # 自动机按结束位置产出匹配，和正则保持一致：取起点最靠前的，起点相同取最长的
+            best = None
+            for end, word in self._automaton.iter(text):
+                key = (end - len(word) + 1, -len(word))
+                if best is None or key < best[0]:
+                    best = (key, word)
+            return self._routes[best[1]] if best else None
+        found = self._pattern.search(text)
+        return self._routes[found.group()] if found else None
+
+
+class KeywordRouter(Runnable):
+    """
+    代替 RunnableBranch 的预路由：每次调用只计算一次路由键，再按字典取出分支执行，
+    不像 RunnableBranch 那样逐个分支调用判断函数
+
+    Args:
+        branches (Dict[str, Runnable]): 路由名 -> 分支链
+        keywords (Dict[str, List[str]]): 路由名 -> 关键词列表
+        default (str): 没有关键词命中时使用的路由
+        input_key (str): 输入字典中参与匹配的字段
+    """
+
+    def __init__(self, branches: Dict[str, Runnable], keywords: Dict[str, List[str]],
+                 default: str, input_key: str = "query"):
+        self.branches = branches
+        self.matcher = KeywordMatcher(keywords)
+        self.default = default
+        self.input_key = input_key
+
+    def route(self, inputs: dict) -> str:
+        return self.matcher.match(inputs[self.input_key]) or self.default
+
+    def invoke(self, input: dict, config: RunnableConfig = None, **kwargs):
+        return self.branches[self.route(input)].invoke(input, config, **kwargs)
+
+
+# 初始化Ollama聊天模型，指定使用qwen3:8b模型，关闭推理模式；外面包一层响应缓存，cache_sampled=True 表示同样的提问直接复用上次的回答
+model = CachedChatModel(ChatOllama(model="qwen3:8b", reasoning=False), cache=llm_cache, cache_sampled=True)
 # 创建字符串输出解析器，用于处理模型输出
 parser = StrOutputParser()
+# 每种语言对应的提示词
+prompts = {
+    "japanese": japanese_prompt,
+    "korean": korean_prompt,
+    "english": english_prompt,
+}
 # 创建一个可运行的分支链，根据输入文本的语言类型选择相应的处理流程
 # 返回值：
-#   RunnableBranch对象，可根据输入动态选择执行路径的可运行链
-chain = RunnableBranch(
-    (lambda x: determine_language(x) == "japanese", japanese_prompt | model | parser),
-    (lambda x: determine_language(x) == "korean", korean_prompt | model | parser),
-    (english_prompt | model | parser)
+#   KeywordRouter对象，语言只判断一次，再按字典分发到对应分支
+chain = KeywordRouter(
+    {lang: lang_prompt | model | parser for lang, lang_prompt in prompts.items()},
+    ROUTE_KEYWORDS,
+    default=DEFAULT_ROUTE,
 )
 
 # 测试查询
@@ -96,25 +357,17 @@ test_queries = [
 ]
 
 for query_input in test_queries:
-    # 判断使用哪个提示词
-    lang = determine_language(query_input)
+    # 判断使用哪个提示词，用于打印格式化后的提示词
+    lang = chain.route(query_input)
     logger.info(f"检测到语言类型: {lang}")
 
-    # 根据语言类型选择对应的提示词并格式化
-    if lang == "japanese":
-        prompt = japanese_prompt
-    elif lang == "korean":
-        prompt = korean_prompt
-    else:
-        prompt = english_prompt
-
     # 格式化提示词并打印
-    formatted_messages = prompt.format_messages(**query_input)
+    formatted_messages = prompts[lang].format_messages(**query_input)
     logger.info("格式化后的提示词:")
     for msg in formatted_messages:
         logger.info(f"[{msg.type}]: {msg.content}")
 
-    # 执行链
+    # 执行链：KeywordRouter 内部匹配一次关键词，再按字典取分支
     result = chain.invoke(query_input)
     logger.info(f"输出结果: {result}\n")
 
@@ -124,8 +377,8 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_ollama import ChatOllama
 from loguru import logger
 
-# 设置本地模型，不使用深度思考
-model = ChatOllama(model="qwen3:8b", reasoning=False)
+# 设置本地模型，不使用深度思考；外面包一层响应缓存，cache_sampled=True 表示同样的提问直接复用上次的回答
+model = CachedChatModel(ChatOllama(model="qwen3:8b", reasoning=False), cache=llm_cache, cache_sampled=True)
 
 # 子链1提示词
 prompt1 = ChatPromptTemplate.from_messages([
@@ -154,6 +407,7 @@ full_chain = chain1 | (lambda content: {"input": content}) | chain2
 # 调用复合链
 result = full_chain.invoke({"topic": "langchain"})
 logger.info(result)
+logger.info(f"响应缓存统计: {model.stats()}")
 
 # 并行链
 from langchain_core.output_parsers import StrOutputParser
@@ -162,8 +416,8 @@ from langchain_ollama import ChatOllama
 from langchain_core.runnables import RunnableParallel
 from loguru import logger
 
-# 设置本地模型，不使用深度思考
-model = ChatOllama(model="qwen3:8b", reasoning=False)
+# 设置本地模型，不使用深度思考；外面包一层响应缓存，cache_sampled=True 表示同样的提问直接复用上次的回答
+model = CachedChatModel(ChatOllama(model="qwen3:8b", reasoning=False), cache=llm_cache, cache_sampled=True)
 
 # 并行链1提示词
 prompt1 = ChatPromptTemplate.from_messages([
@@ -210,8 +464,8 @@ def retrieval_doc(question):
     return "你是一个说话风趣幽默的AI助手，你叫亮仔"
 
 
-# 设置本地模型，不使用深度思考
-model = ChatOllama(model="qwen3:8b", reasoning=False)
+# 设置本地模型，不使用深度思考；外面包一层响应缓存，cache_sampled=True 表示同样的提问直接复用上次的回答
+model = CachedChatModel(ChatOllama(model="qwen3:8b", reasoning=False), cache=llm_cache, cache_sampled=True)
 
 # 构建提示词
 prompt = ChatPromptTemplate.from_messages([
@@ -1,23 +1,134 @@
 import os
+import glob
+import queue
+import threading
+from pathlib import Path
 from datetime import datetime
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.documents import Document
 from langchain.document_loaders.base import BaseLoader
 
+_FILE_DONE = object()  # 生产线程读完一个文件后放进队列的结束标记
+
+
 class SimpleQALoader(BaseLoader):
     """
     简单的问答文件加载器
     
     该加载器用于从文本文件中加载问答对，文件格式要求每两行为一组，
     第一行为问题(Q)，第二行为答案(A)
+
+    file_path 可以是单个文件、目录（按 pattern 匹配其中的文件）或通配符路径；
+    多个文件时用线程并发读取，文档经有界队列逐个交给调用方，内存占用与文件大小无关。
     
     Args:
-        file_path (str): 问答文件的路径
+        file_path (str): 问答文件的路径、目录或通配符，例如 "data/*.txt"
         time_fmt (str): 时间格式字符串，默认为 "%Y-%m-%d %H:%M:%S"
+        pattern (str): file_path 为目录时匹配文件的模式
+        max_workers (int): 并发读取的文件数
+        queue_size (int): 读取线程与调用方之间缓冲的最大文档数
     """
 
-    def __init__(self, file_path: str, time_fmt: str = "%Y-%m-%d %H:%M:%S"):
+    def __init__(self, file_path: str, time_fmt: str = "%Y-%m-%d %H:%M:%S",
+                 pattern: str = "**/*.txt", max_workers: int = 4, queue_size: int = 1000):
         self.file_path = file_path
         self.time_fmt = time_fmt
+        self.pattern = pattern
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+
+    def _paths(self) -> list[str]:
+        """展开目录和通配符，按路径排序"""
+        if os.path.isdir(self.file_path):
+            return sorted(str(p) for p in Path(self.file_path).glob(self.pattern) if p.is_file())
+        if glob.has_magic(self.file_path):
+            return sorted(p for p in glob.glob(self.file_path, recursive=True) if os.path.isfile(p))
+        return [self.file_path]
+
+    def _iter_file(self, path: str) -> Iterator[Document]:
+        """
+        逐行读取一个问答文件，每两行非空行产出一个文档。
+        文件创建时间每个文件只取一次；行数为奇数时最后一个问题的答案为空。
+        """
+        created_at = datetime.fromtimestamp(os.path.getctime(path)).strftime(self.time_fmt)
+        question = None
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if question is None:
+                    question = line
+                    continue
+                yield self._make_doc(question, line, path, created_at)
+                question = None
+        if question is not None:
+            yield self._make_doc(question, "", path, created_at)
+
+    @staticmethod
+    def _make_doc(question: str, answer: str, path: str, created_at: str) -> Document:
+        q = question.lstrip("Q：:").strip()
+        a = answer.lstrip("A：:").strip()
+        return Document(
+            page_content=f"Q: {q}\nA: {a}",
+            metadata={"source": path, "created_at": created_at}
+        )
+
+    @staticmethod
+    def _put(out: queue.Queue, item, stop: threading.Event) -> bool:
+        """队列满时等待；调用方已停止消费就放弃，返回 False"""
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, path: str, out: queue.Queue, stop: threading.Event):
+        """读取线程：把一个文件的文档逐个放进队列，异常也交给调用方抛出"""
+        try:
+            for doc in self._iter_file(path):
+                if not self._put(out, doc, stop):
+                    return
+        except Exception as e:
+            self._put(out, e, stop)
+        self._put(out, _FILE_DONE, stop)
+
+    def lazy_load(self) -> Iterator[Document]:
+        """
+        惰性加载：逐个产出文档，不把整个文件读进列表。
+        只有一个文件时直接顺序读取；多个文件时并发读取，
+        文档顺序在单个文件内保持不变，不同文件之间交错。
+        
+        Returns:
+            Iterator[Document]: 包含问答内容的文档，每个文档包含page_content和metadata
+        """
+        paths = self._paths()
+        if len(paths) <= 1 or self.max_workers <= 1:
+            for path in paths:
+                yield from self._iter_file(path)
+            return
+
+        out = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for path in paths:
+                pool.submit(self._produce, path, out, stop)
+            remaining = len(paths)
+            try:
+                while remaining:
+                    item = out.get()
+                    if item is _FILE_DONE:
+                        remaining -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+            finally:
+                # 调用方提前结束或出错时通知读取线程退出
+                stop.set()
 
     def load(self):
         """
@@ -29,29 +140,7 @@ class SimpleQALoader(BaseLoader):
         Returns:
             list[Document]: 包含问答内容的文档列表，每个文档包含page_content和metadata
         """
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            lines = [line.strip() for line in f if line.strip()]
-
-        docs = []
-        created_ts = os.path.getctime(self.file_path)
-        created_at = datetime.fromtimestamp(created_ts).strftime(self.time_fmt)
-
-        # 每两行构成一个 Q/A
-        for i in range(0, len(lines), 2):
-            q = lines[i].lstrip("Q：:").strip()
-            a = lines[i+1].lstrip("A：:").strip()
-            page_content = f"Q: {q}\nA: {a}"
-
-            doc = Document(
-                page_content=page_content,
-                metadata={
-                    "source": self.file_path,
-                    "created_at": created_at,
-                }
-            )
-            docs.append(doc)
-
-        return docs
+        return list(self.lazy_load())
 
 
 # 使用示例
@@ -64,43 +153,24 @@ if __name__ == "__main__":
         print(d.page_content)
         print("元数据：", d.metadata)
 
+    # 整个目录的问答文件：lazy_load 并发读取、逐个产出，可以直接按批送去做 Embedding
+    if os.path.isdir("qa_files"):
+        total = sum(1 for _ in SimpleQALoader("qa_files", pattern="*.txt", max_workers=8).lazy_load())
+        print(f"目录 qa_files 共流式解析到 {total} 个文档")
+
 # 自定义文本分割器
+import time
 from typing import List
 
 from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import TextSplitter
 
+# 分割器放在 text_splitter.py，可以单独导入和测试；token 估算复用 RAG 目录下的 context_packer
+from text_splitter import CustomTextSplitter, estimate_tokens
 
-class CustomTextSplitter(TextSplitter):
-    """
-    自定义文本分割器类
-    
-    该类继承自TextSplitter，用于将文本按照特定规则进行分割
-    分割策略：首先按段落分割，然后对每个段落提取第一句话
-    """
 
-    def split_text(self, text: str) -> List[str]:
-        """
-        将输入文本分割成多个文本片段
-        
-        参数:
-            text (str): 需要分割的原始文本字符串
-            
-        返回:
-            List[str]: 分割后的文本片段列表，每个片段为段落的第一句话
-        """
-        text = text.strip()
-        # 1.按段落进行分割
-        text_array = text.split("\n\n")
-
-        result_texts = []
-        for text_item in text_array:
-            strip_text_item = text_item.strip()
-            if strip_text_item is None:
-                continue
-            # 2.按句进行分割
-            result_texts.append(strip_text_item.split("。")[0])
-        return result_texts
+def _legacy_split(text: str) -> List[str]:
+    """原先的切分方式：按空行分段，每段只保留第一句，用来对比"""
+    return [item.strip().split("。")[0] for item in text.strip().split("\n\n")]
 
 
 # 1.文档加载
@@ -109,24 +179,136 @@ documents = loader.load()
 document_text = documents[0].page_content
 
 # 2.定义文本分割器
-splitter = CustomTextSplitter()
+splitter = CustomTextSplitter(chunk_size=256, chunk_overlap=32)
 
 # 3.文本分割
 splitter_texts = splitter.split_text(document_text)
 for splitter_text in splitter_texts:
     print(
-        f"文本分割片段大小：{len(splitter_text)}, 文本内容：{splitter_text}")
+        f"文本分割片段大小：{estimate_tokens(splitter_text)} token, 文本内容：{splitter_text}")
+
+# 4.切分速度：把文档重复到几 MB，对比 chunks/s 和保留下来的文本量（只在直接运行时做）
+if __name__ == "__main__":
+    big_text = "\n\n".join([document_text] * max(1, 4_000_000 // max(1, len(document_text))))
+    for name, split in [("legacy", _legacy_split), ("token-aware", splitter.split_text)]:
+        start = time.perf_counter()
+        chunks = split(big_text)
+        elapsed = time.perf_counter() - start
+        kept = sum(len(c) for c in chunks) / len(big_text)
+        print(f"{name:<12} {len(chunks)} 个片段，{len(chunks) / elapsed:.0f} chunks/s，"
+              f"{len(big_text) / elapsed / 1e6:.1f} M字符/s，保留原文 {kept:.0%}")
 
 # 向量数据库
+import uuid
+import asyncio
+import numpy as np
+from langchain_core.embeddings import Embeddings
 from langchain_ollama import OllamaEmbeddings
 from langchain_redis import RedisConfig, RedisVectorStore
 import dotenv
 
+# 复用 RAG 目录下的向量缓存，和 FAQ 检索共用同一份缓存文件
+from rag_shared import load_rag_module
+
+get_cache = load_rag_module("embedding_cache").get_cache
+
+EMBED_BATCH_SIZE = 32     # 每次发给 Ollama 的文本条数
+EMBED_CONCURRENCY = 4     # 同时在途的 Embedding 请求数，太大会把本地 Ollama 压满
+WRITE_BATCH_SIZE = 500    # 写 Redis 时每个 pipeline 的条数
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带持久化缓存的 Embedding 包装器
+
+    按 “模型名 + 文本” 的哈希查缓存，命中直接返回，
+    只有没见过的文本才交给被包装的模型计算
+
+    Args:
+        embeddings (Embeddings): 实际计算向量的模型，例如 OllamaEmbeddings
+        model_name (str): 参与缓存 key 的模型名
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = get_cache()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.embed(self.model_name, texts, self.embeddings.embed_documents)
+        return [vec.tolist() for vec in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str], batch_size: int = EMBED_BATCH_SIZE,
+                               concurrency: int = EMBED_CONCURRENCY) -> List[List[float]]:
+        """
+        异步批量 Embedding：先查缓存，未命中的文本去重后按 batch_size 分批，
+        最多 concurrency 个批次同时发给模型，结果按输入顺序返回并写回缓存。
+        缓存读写是阻塞的 SQLite 调用，放到线程里执行，不卡住事件循环上的其他请求
+        """
+        vectors = await asyncio.to_thread(self.cache.get_many, self.model_name, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def embed_batch(batch: List[str]) -> List[List[float]]:
+                async with semaphore:
+                    return await self.embeddings.aembed_documents(batch)
+
+            batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+            results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+            new_vectors = [np.asarray(v, dtype=np.float32) for batch in results for v in batch]
+            await asyncio.to_thread(self.cache.put_many, self.model_name, missing, new_vectors)
+            computed = dict(zip(missing, new_vectors))
+            vectors = [v if v is not None else computed[t] for t, v in zip(texts, vectors)]
+        return [vec.tolist() for vec in vectors]
+
+
+def ingest_texts(vector_store: RedisVectorStore, texts: List[str], metadatas: List[dict] = None,
+                 vectors: List[List[float]] = None, write_batch: int = WRITE_BATCH_SIZE) -> List[str]:
+    """
+    把文本写进 RedisVectorStore，代替 add_texts：
+    向量只算一次（可直接传入已经算好的 vectors，否则用 vector_store 的 Embedding 并发批量计算），
+    然后按 RedisVectorStore 的字段约定组装记录，经 SearchIndex.load 以 pipeline 分批写入。
+
+    参数:
+        vector_store (RedisVectorStore): 目标向量库，索引已创建。
+        texts (List[str]): 文本列表。
+        metadatas (List[dict]): 每条文本的元数据，可选。
+        vectors (List[List[float]]): 预先算好的向量，可选。
+        write_batch (int): 每个 pipeline 写入的条数。
+
+    返回:
+        List[str]: 写入的 Redis key，与 add_texts 的返回值一致。
+    """
+    start = time.perf_counter()
+    if vectors is None:
+        vectors = asyncio.run(vector_store.embeddings.aembed_documents(texts))
+    metadatas = metadatas or [{} for _ in texts]
+    config = vector_store.config
+    as_bytes = config.storage_type != "json"  # Hash 存二进制向量，JSON 存数组
+    records = [
+        {
+            config.content_field: text,
+            config.embedding_field: np.asarray(vec, dtype=np.float32).tobytes() if as_bytes else vec,
+            **metadata,
+        }
+        for text, vec, metadata in zip(texts, vectors, metadatas)
+    ]
+    keys = [f"{config.key_prefix}:{uuid.uuid4().hex}" for _ in texts]
+    vector_store.index.load(records, keys=keys, batch_size=write_batch)
+    elapsed = time.perf_counter() - start
+    print(f"✅ 已写入 {len(keys)} 条，耗时 {elapsed:.2f}s，{len(keys) / elapsed:.1f} docs/s")
+    return keys
+
+
 # 读取env配置
 dotenv.load_dotenv()
 
-# 初始化 Embedding 模型
-embedding = OllamaEmbeddings(model="deepseek-r1:14b")
+# 初始化 Embedding 模型，外面套一层缓存
+embedding = CachedEmbeddings(OllamaEmbeddings(model="deepseek-r1:14b"), model_name="deepseek-r1:14b")
 
 # ========== 存储数据 ==========
 # 定义待处理的文本数据列表
@@ -137,8 +319,8 @@ texts = [
 ]
 
 # 获取文本向量
-# 使用embedding模型将文本转换为向量表示
-embeddings = embedding.embed_documents(texts)
+# 使用embedding模型将文本转换为向量表示：分批并发请求 Ollama，结果写进缓存
+embeddings = asyncio.run(embedding.aembed_documents(texts))
 
 # 打印结果
 # 遍历并打印每个文本及其对应的向量信息
@@ -147,6 +329,10 @@ for i, vec in enumerate(embeddings, 1):
     print(f"向量长度: {len(vec)}")
     print(f"前5个向量值: {vec[:10]}\n")
 
+# 再算一遍同样的文本会直接命中缓存
+embedding.embed_documents(texts)
+print(f"向量缓存统计: {embedding.cache.stats()}")
+
 # 定义每条文本对应的元数据信息
 metadata = [{"segment_id": "1"}, {"segment_id": "2"}, {"segment_id": "3"}]
 
@@ -159,8 +345,8 @@ config = RedisConfig(
 # 创建Redis向量存储实例
 vector_store = RedisVectorStore(embedding, config=config)
 
-# 将文本和元数据添加到向量存储中
-ids = vector_store.add_texts(texts, metadata)
+# 将文本和元数据添加到向量存储中：直接复用上面算好的向量，pipeline 批量写入
+ids = ingest_texts(vector_store, texts, metadata, vectors=embeddings)
 
 # 打印前5个存储记录的ID
 print(ids[0:5])
@@ -174,8 +360,8 @@ import dotenv
 # 读取env配置
 dotenv.load_dotenv()
 
-# 初始化 Embedding 模型
-embedding = OllamaEmbeddings(model="deepseek-r1:14b")
+# 初始化 Embedding 模型，同样的查询语句第二次不再请求模型
+embedding = CachedEmbeddings(OllamaEmbeddings(model="deepseek-r1:14b"), model_name="deepseek-r1:14b")
 
 # 配置Redis连接参数和索引名称
 config = RedisConfig(
@@ -187,16 +373,70 @@ config = RedisConfig(
 vector_store = RedisVectorStore(embedding, config=config)
 
 
+MMR_FETCH_K = 20          # 一次取回的候选数
+MMR_LAMBDA = 0.5          # 相关性与多样性的权衡，1 只看相关性，0 只看多样性
+SCORE_THRESHOLD = 0.3     # 相似度低于该值的候选直接丢弃
+
+
+def mmr_search(vector_store: RedisVectorStore, query: str, k: int = 3, fetch_k: int = MMR_FETCH_K,
+               lambda_mult: float = MMR_LAMBDA, score_threshold: float = SCORE_THRESHOLD):
+    """
+    带相似度阈值的 MMR（最大边际相关）检索
+
+    查询只 Embedding 一次，用 similarity_search_with_score_by_vector(with_vectors=True) 取回 fetch_k 个候选
+    及其在 Redis 中存的向量，按 1 - 距离 换算相似度并丢掉低于阈值的，剩下的候选向量归一化成矩阵，
+    一次矩阵乘法得到候选之间的相似度，贪心选 k 个：
+    每轮只用新选中那一列更新“与已选结果的最大相似度”，整个过程没有 Python 双重循环。
+
+    参数:
+        vector_store (RedisVectorStore): 向量库，其 embeddings 用于计算查询向量。
+        query (str): 查询文本。
+        k (int): 返回的结果数。
+        fetch_k (int): 候选池大小。
+        lambda_mult (float): MMR 权衡系数。
+        score_threshold (float): 最低相似度。
+
+    返回:
+        List[Tuple[Document, float]]: 按选中顺序排列的 (文档, 相似度)；k <= 0 时为空列表。
+    """
+    if k <= 0:
+        return []
+    query_vec = np.asarray(vector_store.embeddings.embed_query(query), dtype=np.float32)
+    hits = [
+        (doc, 1 - distance, vector)  # 余弦距离转成相似度
+        for doc, distance, vector in vector_store.similarity_search_with_score_by_vector(
+            query_vec.tolist(), k=fetch_k, with_vectors=True)
+        if 1 - distance >= score_threshold
+    ]
+    candidates = [(doc, similarity) for doc, similarity, _ in hits]
+    if len(candidates) <= 1:
+        return candidates[:k]
+
+    doc_vecs = np.asarray([vector for _, _, vector in hits], dtype=np.float32)
+    query_vec /= np.linalg.norm(query_vec) or 1.0
+    doc_vecs /= np.maximum(np.linalg.norm(doc_vecs, axis=1, keepdims=True), 1e-12)
+
+    relevance = doc_vecs @ query_vec          # (n,) 与查询的相似度
+    pairwise = doc_vecs @ doc_vecs.T          # (n, n) 候选之间的相似度
+    max_sim = np.full(len(candidates), -np.inf, dtype=np.float32)
+    selected = [int(np.argmax(relevance))]
+    for _ in range(min(k, len(candidates)) - 1):
+        max_sim = np.maximum(max_sim, pairwise[:, selected[-1]])
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_sim
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return [candidates[i] for i in selected]
+
+
 # ========== 查询数据 ==========
 # 定义查询文本
 query = "我喜欢用什么手机"
 
-# 将查询语句向量化，并在Redis中做相似度检索
-results = vector_store.similarity_search_with_score(query, k=3)
+# 在Redis中一次取回候选，过滤低相似度后用 MMR 选出互不重复的结果
+results = mmr_search(vector_store, query, k=3)
 
 print("=== 查询结果 ===")
-for i, (doc, score) in enumerate(results, 1):
-    similarity = 1 - score  #  score 是距离，可以转成相似度
+for i, (doc, similarity) in enumerate(results, 1):
     print(f"结果 {i}:")
     print(f"内容: {doc.page_content}")
     print(f"元数据: {doc.metadata}")
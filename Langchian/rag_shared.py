@@ -0,0 +1,25 @@
+# 复用 RAG 目录下的模块（向量缓存、token 估算）：按文件路径加载，不改 sys.path
+import os
+import importlib.util
+
+RAG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG")
+
+_modules = {}
+
+
+def load_rag_module(name: str):
+    """
+    加载 RAG/<name>.py 并返回模块对象，同一进程内只加载一次
+
+    模块以 rag_shared.<name> 的名字加载，不会遮住 sys.path 上的同名模块；
+    只适合不再 import RAG 目录下其他模块的独立模块，例如 embedding_cache、context_packer
+    """
+    if name not in _modules:
+        path = os.path.join(RAG_DIR, f"{name}.py")
+        if not os.path.exists(path):
+            raise ImportError(f"找不到 RAG 模块: {path}")
+        spec = importlib.util.spec_from_file_location(f"rag_shared.{name}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[name] = module
+    return _modules[name]
@@ -0,0 +1,44 @@
+# CustomTextSplitter 的切分不能丢字符：片段拼回去必须等于原文
+import pytest
+
+from text_splitter import CustomTextSplitter, estimate_tokens
+
+ENGLISH = (
+    "Hello world! This is English; ok. Version 3.14 ships today, e.g. for the beta users.\n"
+    "Does it split? It should... \"Quoted sentence.\" Then more text without a terminator\n\n"
+    "  Indented paragraph after a blank line. " + "supercalifragilistic" * 12 + " end."
+)
+CHINESE = (
+    "。。。开头的标点也要保留。RAG 是检索增强生成！它先检索，再生成？\n\n"
+    "“引号里的句子。”后面还有（括号里的话）。" + "很长的一句话没有标点" * 20 + "\n结尾没有换行"
+)
+MIXED = "\n\n  前面的空行和缩进。Mixed 中英文 text here. 再来一句；and another one! 最后。\n\n"
+
+
+@pytest.mark.parametrize("text", [ENGLISH, CHINESE, MIXED])
+@pytest.mark.parametrize("chunk_size", [8, 20, 64, 256])
+def test_chunks_concatenate_back_to_text(text, chunk_size):
+    chunks = CustomTextSplitter(chunk_size=chunk_size, chunk_overlap=0).split_text(text)
+    assert "".join(chunks) == text
+    assert all(estimate_tokens(chunk) <= chunk_size for chunk in chunks)
+
+
+@pytest.mark.parametrize("text", [ENGLISH, CHINESE, MIXED])
+def test_overlapping_chunks_are_slices_covering_text(text):
+    splitter = CustomTextSplitter(chunk_size=20, chunk_overlap=6)
+    spans = splitter.split_spans(text)
+    assert splitter.split_text(text) == [text[start:end] for start, end in spans]
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+    for (prev_start, prev_end), (start, end) in zip(spans, spans[1:]):
+        # 起点递增，且和前一个片段首尾相接或重叠，中间没有漏掉的字符
+        assert prev_start < start <= prev_end < end
+    assert all(estimate_tokens(text[start:end]) <= 20 for start, end in spans)
+
+
+def test_english_sentences_keep_separators():
+    chunks = CustomTextSplitter(chunk_size=6, chunk_overlap=0).split_text("Hello world! This is English; ok.")
+    assert chunks == ["Hello world! ", "This is English; ", "ok."]
+
+
+def test_empty_text():
+    assert CustomTextSplitter(chunk_size=20, chunk_overlap=0).split_text("") == []
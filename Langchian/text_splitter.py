@@ -0,0 +1,110 @@
+# 自定义文本分割器：按 token 预算切片，片段都是原文的连续切片，不丢字符
+import re
+from collections import deque
+from typing import List, Tuple
+
+from langchain_text_splitters import TextSplitter
+
+# 复用 RAG 目录下的 token 估算，按文件路径加载，不改 sys.path
+from rag_shared import load_rag_module
+
+estimate_tokens = load_rag_module("context_packer").estimate_tokens
+
+# 句子单元，三种依次尝试，拼起来正好覆盖原文：
+# 1. 一段连续换行，连同下一行开头的缩进；
+# 2. 一句话，连同句末标点、收尾的引号括号和后面的空格；英文句号后面要跟空白或引号才算句末，3.14、e.g 不会被切开；
+# 3. 一行里剩下没有句末标点的部分
+_SENTENCE_RE = re.compile(
+    r"\n+[ \t]*"
+    r"|[^\n]*?(?:[。！？!?；;]+|\.(?=[\s\"'”’)）]|$))+[”’」』）)\"']*[ \t]*"
+    r"|[^\n]+"
+)
+
+
+class CustomTextSplitter(TextSplitter):
+    """
+    自定义文本分割器类
+
+    该类继承自TextSplitter，按 token 预算把文本切成连续的片段：
+    先按中英文句末标点（含英文句号）和换行切成句子，再贪心地把句子装进 chunk_size 个 token 的片段，
+    相邻片段之间保留不超过 chunk_overlap 个 token 的句子作为重叠；单句超长时按字符硬切。
+    每个片段都是原文的一段连续切片，句子之间的空格、换行和标点原样保留，
+    chunk_overlap=0 时把片段依次拼接就是原文。
+    整个过程对文本只扫描一遍，每个句子只进出窗口各一次。
+
+    Args:
+        chunk_size (int): 每个片段的最大 token 数（按 estimate_tokens 估算）
+        chunk_overlap (int): 相邻片段重叠的最大 token 数
+    """
+
+    def __init__(self, chunk_size: int = 256, chunk_overlap: int = 32, **kwargs):
+        kwargs.setdefault("length_function", estimate_tokens)
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+
+    def _units(self, text: str):
+        """
+        产出 (起点, 终点, token 数)，依次覆盖整段原文；换行和空白是 0 token 的分隔，
+        超长句子按比例切成几段。token 估算不是按字符可加的（英文单词从中间切开会多算），
+        每段切出后重新估算，超出 chunk_size 就继续往回缩，保证每段都不超预算
+        """
+        for match in _SENTENCE_RE.finditer(text):
+            start, stop = match.span()
+            tokens = self._length_function(match.group())
+            if tokens <= self._chunk_size:
+                yield start, stop, tokens
+                continue
+            step = max(1, (stop - start) * self._chunk_size // tokens)
+            begin = start
+            while begin < stop:
+                end = min(stop, begin + step)
+                piece_tokens = self._length_function(text[begin:end])
+                while piece_tokens > self._chunk_size and end - begin > 1:
+                    end = begin + min(end - begin - 1, max(1, (end - begin) * self._chunk_size // piece_tokens))
+                    piece_tokens = self._length_function(text[begin:end])
+                yield begin, end, piece_tokens
+                begin = end
+
+    def split_spans(self, text: str) -> List[Tuple[int, int]]:
+        """
+        计算每个片段在原文中的位置
+
+        参数:
+            text (str): 需要分割的原始文本字符串
+
+        返回:
+            List[Tuple[int, int]]: 每个片段的 (起点, 终点)，起点递增；
+            下一个片段的起点不晚于上一个片段的终点，重叠部分就是 chunk_overlap 保留的句子
+        """
+        spans = []
+        window = deque()   # 当前片段中的 (起点, 终点, token 数)
+        used = 0
+
+        def emit():
+            spans.append((window[0][0], window[-1][1]))
+
+        for start, stop, tokens in self._units(text):
+            if tokens and used + tokens > self._chunk_size and used:
+                emit()
+                # 从左边弹出句子，直到剩下的不超过重叠预算，作为下一个片段的开头；
+                # 弹出的句子和分隔都已经在刚输出的片段里
+                while window and (used > self._chunk_overlap or used + tokens > self._chunk_size):
+                    used -= window.popleft()[2]
+                while window and not window[0][2]:
+                    window.popleft()
+            window.append((start, stop, tokens))
+            used += tokens
+        if window:
+            emit()
+        return spans
+
+    def split_text(self, text: str) -> List[str]:
+        """
+        将输入文本分割成多个文本片段
+
+        参数:
+            text (str): 需要分割的原始文本字符串
+
+        返回:
+            List[str]: 分割后的文本片段列表，每个片段是原文的连续切片，token 数不超过 chunk_size
+        """
+        return [text[start:end] for start, end in self.split_spans(text)]
@@ -1,11 +1,19 @@
 import os
 import json
+import time
+import hashlib
 import dotenv
+import dashscope
 import redis
 import numpy as np
+from itertools import islice
 from http import HTTPStatus
-from redis.commands.search.filed import TextFiled, VectorFiled
+from redis.commands.search.field import TextField, VectorField
 from redis.commands.search.index_definition import IndexDefinition
+from embedding_cache import get_cache
+from quantize import encode, decode
+from projection import Projection, PROJECTION_METHOD, PROJECTED_DIM, PCA_SAMPLE
+from text_manage import iter_faq_docs
 
 # 把项目根目录下的 .env 文件加载到环境变量；失败也不会报错，只是没值
 dotenv.load_dotenv()
@@ -14,92 +22,423 @@ dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
 
 INDEX_NAME = "faq_index"    # Redis 搜索索引的名字
 VECTOR_DIM = 1024           # 模型输出的向量维度，multimodal-embedding-v1 固定 1024
+# 索引里实际存储的维度：开启降维（PROJECTION_METHOD=pca/truncate）后为 PROJECTED_DIM，改动后需重建索引
+INDEX_DIM = PROJECTED_DIM if PROJECTION_METHOD != "none" else VECTOR_DIM
 DISTANCE_METRIC = "COSINE"  # 向量距离度量方式，支持 COSINE/IP/L2
+# 向量字段类型：FLOAT32 / FLOAT16（省一半内存）/ INT8（省 3/4，需要 Redis 8），改动后需重建索引
+VECTOR_TYPE = os.getenv("VECTOR_TYPE", "FLOAT32")
+EMBED_MODEL = "multimodal-embedding-v1"  # 向量模型名称
+
+# 批量导入参数
+EMBED_BATCH_SIZE = 10       # 每次 Embedding 请求打包的文本条数
+PIPELINE_CHUNK = 200        # 攒够多少条 HSET 再通过 pipeline 一次性提交
+CHECKPOINT_FILE = "ingest_checkpoint.json"  # 断点续传进度文件
+FAQ_FILE = "faq_processed.jsonl"  # text_manage.process_faq 的输出，每行一条 FAQ
+SCAN_COUNT = 1000           # 增量同步时 SCAN 每次建议返回的 key 数
+INDEX_VERSION_KEY = "faq_meta:version"  # FAQ 数据版本号，数据有变化就加一，不在 faq: 前缀下所以不会被索引
+PROJECTION_KEY = "faq_meta:projection"  # 降维矩阵和索引存在同一个 Redis 里，所有进程查询时用同一个投影
+INDEX_SCHEMA_KEY = "faq_meta:index_schema"  # 建索引时的向量类型/维度/距离度量，和当前配置不一致就重建索引
 
 # 初始化 Redis 客户端
 redis_client = redis.Redis(
     host = "localhost",
     port = 6379,
-    passsword = None,
+    password = None,
     decode_responses = False  # 存二进制向量时必须 False
 )
 
+def _index_schema() -> str:
+    """当前配置下向量字段的类型、维度和距离度量"""
+    return f"{VECTOR_TYPE}:{INDEX_DIM}:{DISTANCE_METRIC}"
+
 # 创建索引
 def create_index():
     """
-    如果索引已存在就跳过；否则创建文本+向量混合索引，前缀限定为 faq:
-    """   
+    索引已存在、且建索引时记下的向量类型/维度/距离度量与当前配置一致就跳过；
+    不一致（或者是没有记录的旧索引）就删掉索引重建，faq: 下的数据保留，
+    否则按新 VECTOR_TYPE 写入的向量和旧索引的 TYPE/DIM 对不上，会悄悄从检索结果里消失。
+    没有索引时创建文本+向量混合索引，前缀限定为 faq:
+    """
+    schema = _index_schema()
     try:
         # 查看索引是否存在
         redis_client.ft(INDEX_NAME).info()
-        print("✅ 索引已存在")
     except Exception:
-        # 真正建索引；字段顺序无关，但名字要与后面 hash 插入保持一致
-        redis_client.ft(INDEX_NAME).create_index(
-            [
-                TextField("question"),   # 问题文本，可全文检索
-                TextField("answer"),
-                TextField("source"),
-                TextField("category"),
-                TextField("crawl_time"),
-                VectorFiled(
-                    "embedding",
-                    "HNSW", # 近似最近邻索引算法，速度快
-                    {
-                        "TYPE": "FLOAT32",
-                        "DIM": VECTOR_DIM,
-                        "DINSTANCE_METRIC": DISTANCE_METRIC
-                    }
-                )
-            ],
-            definition = IndexDefinition(prefix = ["faq:"]) # 只索引以 faq: 开头的 key
-        )
-        print("✅ 已创建向量索引")
+        exists = False
+    else:
+        exists = True
+    if exists:
+        stored = redis_client.get(INDEX_SCHEMA_KEY)
+        stored = stored.decode() if stored is not None else None
+        if stored == schema:
+            print("✅ 索引已存在")
+            return
+        print(f"🔁 索引的向量配置（{stored or '未记录'}）与当前配置（{schema}）不一致，删除索引后重建，数据保留")
+        redis_client.ft(INDEX_NAME).dropindex(delete_documents = False)
+
+    # 真正建索引；字段顺序无关，但名字要与后面 hash 插入保持一致
+    redis_client.ft(INDEX_NAME).create_index(
+        [
+            TextField("question"),   # 问题文本，可全文检索
+            TextField("answer"),
+            TextField("source"),
+            TextField("category"),
+            TextField("crawl_time"),
+            VectorField(
+                "embedding",
+                "HNSW", # 近似最近邻索引算法，速度快
+                {
+                    "TYPE": VECTOR_TYPE,
+                    "DIM": INDEX_DIM,
+                    "DISTANCE_METRIC": DISTANCE_METRIC
+                }
+            )
+        ],
+        # 只索引以 faq: 开头的 key；文本字段按中文分词，全文检索才能命中中文关键词
+        definition = IndexDefinition(prefix = ["faq:"], language = "chinese")
+    )
+    redis_client.set(INDEX_SCHEMA_KEY, schema)
+    print("✅ 已创建向量索引")
+
+# 调用模型批量生成向量
+def _call_embedding(texts: list[str]) -> list[np.ndarray]:
+    """
+    一次请求把多条文本送进 Embedding 模型，按输入顺序返回 float32 向量。
+    """
+    resp = dashscope.MultiModalEmbedding.call(
+        model = EMBED_MODEL,
+        input = [{"text": text} for text in texts]
+    )
+    if resp.status_code != HTTPStatus.OK:
+        raise RuntimeError(f"❌ Embedding 调用失败: {resp.code}, {resp.message}")
+
+    # 返回结果带 index 字段，按它排序，保证和输入顺序对齐
+    embeddings = sorted(resp.output["embeddings"], key = lambda e: e["index"])
+    return [np.asarray(e["embedding"], dtype = np.float32) for e in embeddings]
+
+# 批量生成向量（带缓存）
+def embed_texts(texts: list[str]) -> list[np.ndarray]:
+    """
+    先查向量缓存，只把没见过的文本按 EMBED_BATCH_SIZE 分批送进模型。
+
+    参数:
+        texts (list[str]): 待编码的文本，条数不限。
+
+    返回:
+        list[np.ndarray]: 与 texts 一一对应的 float32 向量列表。
+    """
+    def embed_in_batches(missing: list[str]) -> list[np.ndarray]:
+        vectors = []
+        for begin in range(0, len(missing), EMBED_BATCH_SIZE):
+            vectors.extend(_call_embedding(missing[begin:begin + EMBED_BATCH_SIZE]))
+        return vectors
+
+    return get_cache().embed(EMBED_MODEL, texts, embed_in_batches)
+
+def encode_vector(vector: np.ndarray) -> bytes:
+    """把 float32 向量编码成索引字段类型（VECTOR_TYPE）的字节串，写入和查询都要走这里"""
+    return encode(vector, VECTOR_TYPE)
+
+def decode_vector(blob: bytes) -> np.ndarray:
+    """从 Redis 读出的向量字节串还原成 float32"""
+    return decode(blob, VECTOR_TYPE)
+
+_projection = None
+
+def get_projection():
+    """
+    当前索引使用的投影：优先读 Redis 中和索引一起保存的；
+    未开启降维返回 None，PCA 还没训练过也返回 None
+    """
+    global _projection
+    if PROJECTION_METHOD == "none":
+        return None
+    if _projection is None:
+        blob = redis_client.get(PROJECTION_KEY)
+        if blob is not None:
+            _projection = Projection.from_bytes(blob)
+        elif PROJECTION_METHOD == "truncate":
+            _projection = Projection.truncate(PROJECTED_DIM)
+    return _projection
+
+def ensure_projection(docs) -> bool:
+    """
+    PCA 模式下如果还没有投影矩阵，就用前 PCA_SAMPLE 条 FAQ 的向量训练一个并存进 Redis。
+    训练用的向量会进向量缓存，后面正式导入时不会重复请求模型。
+
+    返回:
+        bool: 是否新训练了投影（此时索引里已有的向量都要重写）。
+    """
+    global _projection
+    if PROJECTION_METHOD != "pca" or get_projection() is not None:
+        return False
+    docs = list(islice(docs, PCA_SAMPLE))
+    if len(docs) < PROJECTED_DIM:
+        raise RuntimeError(f"❌ 训练 PCA 至少需要 {PROJECTED_DIM} 条 FAQ，当前只有 {len(docs)} 条")
+    vectors = embed_texts([_text_for_embedding(doc) for doc in docs])
+    _projection = Projection.fit_pca(np.stack(vectors), PROJECTED_DIM)
+    redis_client.set(PROJECTION_KEY, _projection.to_bytes())
+    print(f"✅ 已训练 PCA 投影: {VECTOR_DIM} → {PROJECTED_DIM} 维")
+    return True
+
+def project_vectors(vectors: list[np.ndarray]) -> list[np.ndarray]:
+    """把模型输出的向量投影到索引维度；未开启降维时原样返回"""
+    if PROJECTION_METHOD == "none":
+        return vectors
+    projection = get_projection()
+    if projection is None:
+        raise RuntimeError("❌ PCA 投影矩阵还没有训练，请先运行批量导入或增量同步")
+    return list(projection.apply(np.stack(vectors)))
+
+def embed_for_index(texts: list[str]) -> list[np.ndarray]:
+    """生成向量并投影到索引维度，入库和查询都走这里，保证两边在同一个向量空间"""
+    return project_vectors(embed_texts(texts))
+
+def _text_for_embedding(doc: dict) -> str:
+    """拼接问题+答案，让模型一次编码"""
+    return doc["question"] + " " + doc["answer"]
+
+def faq_key(doc: dict) -> str:
+    """
+    由 来源 + 类别 + 问题 推导出稳定的 key，同一条 FAQ 每次导入都落在同一个 key 上，
+    重跑只会覆盖而不会重复
+    """
+    identity = "\x00".join([doc["metadata"]["source"], doc["metadata"]["category"], doc["question"]])
+    return "faq:" + hashlib.sha1(identity.encode("utf-8")).hexdigest()[:20]
+
+def content_hash(doc: dict) -> str:
+    """
+    FAQ 内容指纹，答案或元数据变了指纹就变；crawl_time 每次爬取都会变，不参与计算。
+    向量类型和索引维度也参与计算：修改 VECTOR_TYPE / PROJECTED_DIM 后，已有的行会被当成变化重新编码写入。
+    """
+    parts = [doc["question"], doc["answer"], doc["metadata"]["source"], doc["metadata"]["category"],
+             VECTOR_TYPE, str(INDEX_DIM)]
+    # dedup.py 合并过来源的 FAQ，来源列表变化也算内容变化
+    if "sources" in doc["metadata"]:
+        parts.append("\n".join(doc["metadata"]["sources"]))
+    content = "\x00".join(parts)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+def _faq_mapping(doc: dict, vector: np.ndarray) -> dict:
+    """把一条 FAQ 和它（已投影）的向量转成 Redis Hash 的字段映射"""
+    mapping = {
+        "question": doc["question"],
+        "answer": doc["answer"],
+        "source": doc["metadata"]["source"],
+        "category": doc["metadata"]["category"],
+        "crawl_time": doc["metadata"]["crawl_time"],
+        "content_hash": content_hash(doc),  # 增量同步时用来判断内容是否变化
+        "embedding": encode_vector(vector) # 按 VECTOR_TYPE 转成二进制存储
+    }
+    if "sources" in doc["metadata"]:
+        mapping["sources"] = "\n".join(doc["metadata"]["sources"])  # 去重时合并的全部来源
+    return mapping
 
 # 单条FAQ插入
 def insert_faq(doc: dict):
     """
-    把一条 FAQ 生成向量后写入 Redis Hash，key 形如 faq:request_id
-    """  
+    把一条 FAQ 生成向量后写入 Redis Hash，key 由 faq_key 根据内容推导
+    """
     # 1. 拼接问题+答案，让模型一次编码
-    text_for_embedding = dec["question"] + " " + doc["answer"]
+    text_for_embedding = _text_for_embedding(doc)
 
-    # 2. 调用 Dashscope API 生成向量
-    resp = dashscope.MultiModaEmbedding.call(
-        model = "multimodal-embedding-v1",
-        input = [{"text": text_for_embedding}]
-    )
+    # 2. 生成向量并投影到索引维度；同样的文本之前编码过就直接用缓存
+    vector = embed_for_index([text_for_embedding])[0]
 
-    # 3.只有 HTTP 200 才继续, 否则打印错误信息
-    if resp.status_code == HTTPStatus.OK:
-        embedding = resp.output["embeddings"][0]["embedding"] # 取出向量
-        vector = np.array(embedding, dtype = np.float(32).tobytes()) # 转成二进制存储
-        # 4. 构造唯一 key；用 DashScope 返回的 request_id 当后缀
-        key = f"faq:{resp.request_id}"
-
-        # 5. 写入 Redis Hash
-        redis_client.hset(key, mapping={
-            "question": doc["question"],
-            "answer": doc["answer"],
-            "source": doc["metadata"]["source"],
-            "category": doc["metadata"]["category"],
-            "crawl_time": doc["metadata"]["crawl_time"],
-            "embedding": vector
-        })
-        print(f"✅ 已写入 Redis, key={key}")
-    else:
-        print(f"❌ Embedding 调用失败: {resp.code}, {resp.message}")
+    # 3. 构造稳定 key，重复导入会覆盖旧值
+    key = faq_key(doc)
+
+    # 4. 写入 Redis Hash
+    redis_client.hset(key, mapping = _faq_mapping(doc, vector))
+    print(f"✅ 已写入 Redis, key={key}")
 
 # 批量插入 FAQ
-def insert_from_file(file_path: str = "faq_processed.json"):
+def insert_from_file(file_path: str = FAQ_FILE):
     """
-    读取前面清洗好的 JSON，逐条调用 insert_faq
+    逐行读取前面清洗好的 JSONL，逐条调用 insert_faq
     """
-    with open(file_path, "r", encoding="utf-8") as f:
-        docs = json.loaf(f) # 读取 JSON 文件 生成 Python 列表
-    for doc in docs:
+    for doc in iter_faq_docs(file_path):
         insert_faq(doc)
 
+def _load_checkpoint(checkpoint_file: str, file_path: str) -> int:
+    """
+    读取断点文件，返回已经成功写入 Redis 的条数。
+    输入文件换了或被改过（大小/修改时间不一致）就从 0 开始。
+    """
+    if not os.path.exists(checkpoint_file):
+        return 0
+    with open(checkpoint_file, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    stat = os.stat(file_path)
+    if (state.get("file") != os.path.abspath(file_path)
+            or state.get("size") != stat.st_size
+            or state.get("mtime") != stat.st_mtime):
+        return 0
+    return state.get("done", 0)
+
+def _save_checkpoint(checkpoint_file: str, file_path: str, done: int):
+    """把进度写到临时文件再原子替换，避免写一半崩溃留下坏文件"""
+    stat = os.stat(file_path)
+    tmp_file = checkpoint_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "file": os.path.abspath(file_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "done": done
+        }, f)
+    os.replace(tmp_file, checkpoint_file)
+
+# 批量 + pipeline 导入
+def insert_from_file_bulk(
+    file_path: str = FAQ_FILE,
+    batch_size: int = EMBED_BATCH_SIZE,
+    chunk_size: int = PIPELINE_CHUNK,
+    checkpoint_file: str = CHECKPOINT_FILE
+):
+    """
+    批量导入 FAQ：逐行读取 JSONL，每次 Embedding 请求打包 batch_size 条文本，
+    HSET 先攒进 pipeline，满 chunk_size 条再一次性提交，并打印吞吐量（条/秒）。
+    任何时刻内存里只有一个 pipeline 批次的 FAQ，文件再大峰值内存也不变。
+
+    每次 pipeline 提交成功后把进度写进 checkpoint_file，
+    中途崩溃重跑时从上次提交的位置继续，全部完成后删除断点文件。
+
+    参数:
+        file_path (str): 清洗好的 FAQ JSONL 文件路径。
+        batch_size (int): 每次 Embedding 请求的文本条数。
+        chunk_size (int): 每次 pipeline 提交的 HSET 条数。
+        checkpoint_file (str): 断点续传进度文件路径。
+    """
+    ensure_projection(iter_faq_docs(file_path))
+
+    done = _load_checkpoint(checkpoint_file, file_path)
+    if done:
+        print(f"⏩ 从断点继续，已完成 {done} 条")
+
+    # transaction=False：只是为了减少往返，不需要 MULTI/EXEC 事务
+    pipe = redis_client.pipeline(transaction = False)
+    pending = 0
+    start = time.perf_counter()
+    started_at = end = done
+    docs = islice(iter_faq_docs(file_path), done, None)  # 跳过断点之前的行
+
+    while True:
+        batch = list(islice(docs, batch_size))
+        if batch:
+            vectors = embed_for_index([_text_for_embedding(doc) for doc in batch])
+            for doc, vector in zip(batch, vectors):
+                pipe.hset(faq_key(doc), mapping = _faq_mapping(doc, vector))
+            pending += len(batch)
+            end += len(batch)
+
+        # 攒够一批或者文件已读完，就提交 pipeline 并记录进度
+        if pending >= chunk_size or (not batch and pending):
+            pipe.execute()
+            pending = 0
+            _save_checkpoint(checkpoint_file, file_path, end)
+            elapsed = time.perf_counter() - start
+            rate = (end - started_at) / elapsed if elapsed > 0 else 0.0
+            print(f"✅ 已写入 {end} 条，吞吐 {rate:.1f} docs/s")
+        if not batch:
+            break
+
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    redis_client.incr(INDEX_VERSION_KEY)  # 通知下游缓存 FAQ 已变化
+    elapsed = time.perf_counter() - start
+    print(f"🎉 导入完成，共 {end - started_at} 条，耗时 {elapsed:.2f}s")
+    print(f"📦 向量缓存: {get_cache().stats()}")
+
+# 读取 Redis 里已索引 FAQ 的内容指纹
+def _indexed_hashes() -> dict:
+    """
+    SCAN 出所有 faq:* key，再用 pipeline 批量取 content_hash。
+    老版本写入的 key 没有 content_hash，值为 None，同步时会被当成多余数据删除。
+    """
+    keys = [key.decode() for key in redis_client.scan_iter(match = "faq:*", count = SCAN_COUNT)]
+    hashes = {}
+    for begin in range(0, len(keys), PIPELINE_CHUNK):
+        part = keys[begin:begin + PIPELINE_CHUNK]
+        pipe = redis_client.pipeline(transaction = False)
+        for key in part:
+            pipe.hget(key, "content_hash")
+        for key, value in zip(part, pipe.execute()):
+            hashes[key] = value.decode() if value is not None else None
+    return hashes
+
+def _write_docs(pairs: list[tuple]):
+    """给一批 (key, FAQ) 生成向量（缓存命中的不会请求模型），pipeline 写入"""
+    vectors = embed_for_index([_text_for_embedding(doc) for _, doc in pairs])
+    pipe = redis_client.pipeline(transaction = False)
+    for (key, doc), vector in zip(pairs, vectors):
+        pipe.hset(key, mapping = _faq_mapping(doc, vector))
+    pipe.execute()
+
+# 增量同步
+def sync_from_file(file_path: str = FAQ_FILE) -> dict:
+    """
+    把 process_faq 产出的 JSONL 和 Redis 中已有索引做对比，只处理差异：
+    新增/内容变化的 FAQ 重新生成向量并写入，文件中已不存在的 FAQ 从 Redis 删除，
+    没变的 FAQ 既不调用模型也不写 Redis。
+
+    文件读两遍：第一遍只记下每条 FAQ 的 key 和内容指纹，第二遍按批取出变化的 FAQ 写入，
+    内存中不保存 FAQ 正文。
+
+    参数:
+        file_path (str): 清洗好的 FAQ JSONL 文件路径。
+
+    返回:
+        dict: 各类变化的条数，包含 added / updated / deleted / unchanged。
+    """
+    start = time.perf_counter()
+
+    # 同一个 key 出现多次时以最后一次为准
+    desired = {faq_key(doc): content_hash(doc) for doc in iter_faq_docs(file_path)}
+    indexed = _indexed_hashes()
+    if ensure_projection(iter_faq_docs(file_path)):
+        # 新训练了投影，旧向量不在同一个空间里，全部按变化处理重新写入
+        indexed = {key: None for key in indexed}
+
+    added, updated = [], []
+    for key, digest in desired.items():
+        if key not in indexed:
+            added.append(key)
+        elif indexed[key] != digest:
+            updated.append(key)
+    deleted = [key for key in indexed if key not in desired]
+
+    # 新增和变化的 FAQ：第二遍读文件，只取指纹与最终版本一致的那一行，分批写入
+    changed = set(added + updated)
+    batch = []
+    for doc in iter_faq_docs(file_path):
+        key = faq_key(doc)
+        if key in changed and content_hash(doc) == desired[key]:
+            changed.discard(key)  # 重复出现的行只写一次
+            batch.append((key, doc))
+            if len(batch) >= PIPELINE_CHUNK:
+                _write_docs(batch)
+                batch = []
+    if batch:
+        _write_docs(batch)
+
+    # 已下线的 FAQ：批量删除
+    for begin in range(0, len(deleted), PIPELINE_CHUNK):
+        redis_client.delete(*deleted[begin:begin + PIPELINE_CHUNK])
+
+    if added or updated or deleted:
+        redis_client.incr(INDEX_VERSION_KEY)  # 通知下游缓存 FAQ 已变化
+
+    summary = {
+        "added": len(added),
+        "updated": len(updated),
+        "deleted": len(deleted),
+        "unchanged": len(desired) - len(added) - len(updated),
+    }
+    print(f"🔄 增量同步完成: {summary}，耗时 {time.perf_counter() - start:.2f}s")
+    return summary
+
 if __name__ == "__main__":
     create_index()
-    insert_from_file("faq_processed.json")
\ No newline at end of file
+    # 首次全量导入用 insert_from_file_bulk，之后每天跑增量同步即可
+    sync_from_file(FAQ_FILE)
@@ -1,10 +1,15 @@
 import os
+import re
 import dotenv
 import dashscope
 import redis
 import numpy as np
+from types import SimpleNamespace
 from http import HTTPStatus
 from redis.commands.search.query import Query
+from Embedding_model import embed_for_index, encode_vector, INDEX_DIM
+from local_search import get_local_index
+from quantize import get_pq_index
 
 # ========== 配置 ==========
 # 加载环境变量
@@ -14,10 +19,22 @@ dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
 
 # Redis 向量索引名称
 INDEX_NAME = "faq_index"
-# 向量维度，用于模型 "multimodal-embedding-v1"
-VECTOR_DIM = 1024
+# 索引中的向量维度：模型 "multimodal-embedding-v1" 输出 1024 维，开启降维后为投影后的维度
+VECTOR_DIM = INDEX_DIM
 # 默认返回最相似的前 K 条结果
 TOP_K = 3
+# 检索后端：redis 走 RediSearch KNN，local 走进程内的 NumPy 向量索引，pq 走乘积量化 + 精排
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "redis")
+# 批量检索时每个 pipeline 最多装多少条 KNN 查询
+BATCH_PIPELINE_SIZE = 500
+# 检索结果需要返回的字段
+RETURN_FIELDS = ("question", "answer", "source", "category", "crawl_time", "score")
+# 混合检索：每一路各召回多少候选，以及 RRF 融合的平滑常数
+HYBRID_CANDIDATES = 20
+RRF_K = 60
+
+# 全文查询里有特殊含义的字符，拼查询前统一替换成分隔符
+_QUERY_SPECIAL_RE = re.compile(r"[\s,.<>{}\[\]\"':;!@#$%^&*()\-+=~|/\\，。？！、；：“”‘’（）《》【】?]+")
 
 # 初始化 Redis 客户端连接
 redis_client = redis.Redis(
@@ -38,16 +55,10 @@ def embed_question(question: str):
     返回：
         bytes: 转换后的向量，字节格式。
     """
-    resp = deshscope.MultiModalEmbedding.ccll(
-        model = "multimodal-embedding-v1",
-        input = [{"text": question}]
-    )
-    if resp.status_code == HTTPStatue.OK:
-        embedding = resp.output["embeddings"][0]["embedding"]
-        return np.array(embedding, dtype = np.float32).tobytes()
-        # 先转 NumPy（内存连续），再转字节流（32 bit × 1024 = 4096 字节），Redis 向量字段只接受这种格式。
-    else:
-        raise RuntimeError(f"❌ Embedding 调用失败: {resp.code}, {resp.message}")
+    # 走共享的向量缓存，高频问题不会重复请求模型
+    embedding = embed_for_index([question])[0]
+    return encode_vector(embedding)
+    # 按索引的向量类型（VECTOR_TYPE，默认 FLOAT32：32 bit × 1024 = 4096 字节）转成字节流，Redis 向量字段只接受这种格式。
 
 # 相似度搜索
 def search_faq(question: str, top_k = TOP_K):
@@ -57,27 +68,37 @@ def search_faq(question: str, top_k = TOP_K):
     参数:
         question (str): 用户提出的问题。
         top_k (int): 返回最相似的前 K 条结果，默认值为 TOP_K。
+
+    返回:
+        list: 匹配的文档对象列表。
     """
-    # 将问题转换为向量
-    q_vector = embed_question(question)
+    if SEARCH_BACKEND == "local":
+        # 本地索引：一次矩阵乘法 + argpartition，返回的文档形状和 Redis 结果一致
+        docs = get_local_index(redis_client).search(embed_for_index([question])[0], top_k)
+    elif SEARCH_BACKEND == "pq":
+        # PQ 编码粗排 + 原始向量精排
+        docs = get_pq_index(redis_client).search(embed_for_index([question])[0], top_k)
+    else:
+        # 将问题转换为向量
+        q_vector = embed_question(question)
 
-    # 构造KNN查询语句
-    query = (
-        # 在所有文档（*）里做 K 近邻搜索，把向量字段 @embedding 与参数 $vec 比距离，返回 top_k 个，并把距离写入临时字段 score
-        Query(f"*=>[KNN{top_k} @embedding $vec AS score]")
-        .sort_by("score")
-        .return_fileds("question", "answer", "source", "category", "crawl_time", "score")
-        .dialect(2)
-    )
+        # 构造KNN查询语句
+        query = (
+            # 在所有文档（*）里做 K 近邻搜索，把向量字段 @embedding 与参数 $vec 比距离，返回 top_k 个，并把距离写入临时字段 score
+            Query(f"*=>[KNN {top_k} @embedding $vec AS score]")
+            .sort_by("score")
+            .return_fields("question", "answer", "source", "category", "crawl_time", "score")
+            .dialect(2)
+        )
 
-    # 执行查询并获取结果
-    results = redis_client.ft(INDEX_NAME).search(query, query_params = {"vec": q_vector})
+        # 执行查询并获取结果
+        docs = redis_client.ft(INDEX_NAME).search(query, query_params = {"vec": q_vector}).docs
 
     print(f"\n🔎 用户问题: {question}")
-    print(f"📊 召回 {len(results.docs)} 条结果\n")
+    print(f"📊 召回 {len(docs)} 条结果\n")
 
      # 打印每条匹配结果的详细信息
-    for i, doc in enumerate(results.docs, start=1):
+    for i, doc in enumerate(docs, start=1):
         print(f"--- Top {i} ---")
         print(f"相似度分数: {doc.score}")
         print(f"Q: {doc.question}")
@@ -86,12 +107,158 @@ def search_faq(question: str, top_k = TOP_K):
         print(f"类别: {doc.category}")
         print(f"时间: {doc.crawl_time}")
         print()
+    return docs
+
+def _knn_args(q_vector: bytes, top_k: int, prefilter: str = "*") -> list:
+    """
+    拼出 FT.SEARCH 的原始参数，和 search_faq 里 Query 对象生成的命令等价；
+    prefilter 为 KNN 之前的过滤条件，默认 * 表示在全部文档里找
+    """
+    return [
+        "FT.SEARCH", INDEX_NAME, f"({prefilter})=>[KNN {top_k} @embedding $vec AS score]",
+        "PARAMS", 2, "vec", q_vector,
+        "SORTBY", "score",
+        "RETURN", len(RETURN_FIELDS), *RETURN_FIELDS,
+        "LIMIT", 0, top_k,
+        "DIALECT", 2,
+    ]
+
+def _parse_search_reply(reply) -> list:
+    """
+    解析 FT.SEARCH 的原始返回：[总数, key1, [字段, 值, ...], key2, ...]，
+    转成和 ft().search().docs 一样可以用 doc.question 访问的对象
+    """
+    docs = []
+    for i in range(1, len(reply), 2):
+        fields = reply[i + 1]
+        doc = {
+            fields[j].decode(): fields[j + 1].decode("utf-8", errors="replace")
+            for j in range(0, len(fields), 2)
+        }
+        docs.append(SimpleNamespace(id=reply[i].decode(), **doc))
+    return docs
+
+# 批量相似度搜索
+def search_faq_batch(questions: list[str], top_k = TOP_K) -> list:
+    """
+    一次处理一批问题：所有问题合并成批量 Embedding 请求，
+    KNN 查询装进 pipeline 一次往返发给 Redis；本地后端则用一次矩阵乘法算出全部得分。
+
+    参数:
+        questions (list[str]): 问题列表。
+        top_k (int): 每个问题返回的结果数。
+
+    返回:
+        list[list]: 与 questions 顺序一致，每个问题对应一个文档列表；questions 为空时返回空列表。
+    """
+    if not questions:
+        return []
+    vectors = embed_for_index(questions)
+
+    if SEARCH_BACKEND == "local":
+        return get_local_index(redis_client).search_batch(np.vstack(vectors), top_k)
+    if SEARCH_BACKEND == "pq":
+        pq_index = get_pq_index(redis_client)
+        return [pq_index.search(vector, top_k) for vector in vectors]
+
+    results = []
+    for begin in range(0, len(vectors), BATCH_PIPELINE_SIZE):
+        pipe = redis_client.pipeline(transaction = False)
+        for vector in vectors[begin:begin + BATCH_PIPELINE_SIZE]:
+            pipe.execute_command(*_knn_args(encode_vector(vector), top_k))
+        results.extend(_parse_search_reply(reply) for reply in pipe.execute())
+    return results
+
+def _category_filter(category: str) -> str:
+    """类别过滤条件，类别名按短语匹配"""
+    return f'@category:"{_QUERY_SPECIAL_RE.sub(" ", category).strip()}"'
+
+def _text_args(question: str, top_k: int, category: str = None) -> list:
+    """
+    全文检索参数：问题按标点切成若干短语，在 question/answer 字段里做 OR 匹配，
+    用 BM25 打分，中文按 chinese 分词；问题只有标点或空白、切不出短语时返回 None
+    """
+    phrases = [p for p in _QUERY_SPECIAL_RE.split(question) if p]
+    if not phrases:
+        return None
+    text_query = "@question|answer:(" + "|".join(phrases) + ")"
+    if category:
+        text_query = f"{_category_filter(category)} {text_query}"
+    fields = [f for f in RETURN_FIELDS if f != "score"]
+    return [
+        "FT.SEARCH", INDEX_NAME, text_query,
+        "LANGUAGE", "chinese",
+        "SCORER", "BM25",
+        "RETURN", len(fields), *fields,
+        "LIMIT", 0, top_k,
+        "DIALECT", 2,
+    ]
+
+def reciprocal_rank_fusion(result_lists: list, top_k: int, rrf_k: int = RRF_K) -> list:
+    """
+    RRF 融合：文档在每一路结果中的名次 r 贡献 1 / (rrf_k + r)，按总分从高到低取 top_k。
+    只看名次不看原始分数，BM25 分和向量距离不需要归一化到同一尺度。
+    """
+    fused, docs = {}, {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start = 1):
+            fused[doc.id] = fused.get(doc.id, 0.0) + 1.0 / (rrf_k + rank)
+            # 优先保留带向量距离 score 的那份文档
+            if doc.id not in docs or not hasattr(docs[doc.id], "score"):
+                docs[doc.id] = doc
+    ranked = sorted(fused, key = fused.get, reverse = True)[:top_k]
+    for doc_id in ranked:
+        docs[doc_id].rrf_score = fused[doc_id]
+    return [docs[doc_id] for doc_id in ranked]
+
+# 混合检索
+def search_faq_hybrid(question: str, top_k = TOP_K, category: str = None,
+                      candidates: int = HYBRID_CANDIDATES) -> list:
+    """
+    BM25 全文检索 + 向量 KNN 检索，两条查询放进同一个 pipeline 一次往返，再用 RRF 融合。
+    像 “7次订单” 这种精确关键词靠全文检索兜底，语义相近的问法靠向量检索召回。
+    问题里没有可检索的词（只有标点或空白）时跳过全文检索，只返回 KNN 结果。
+
+    参数:
+        question (str): 用户提出的问题。
+        top_k (int): 融合后返回的结果数。
+        category (str): 可选，只在该类别内检索；KNN 会先按类别过滤再找近邻，搜索空间更小。
+        candidates (int): 每一路召回的候选数。
+
+    返回:
+        list: 按融合分从高到低排列的文档，额外带 rrf_score 字段。
+    """
+    q_vector = embed_question(question)
+    prefilter = _category_filter(category) if category else "*"
+
+    text_args = _text_args(question, candidates, category)
+    if text_args is None:
+        knn_reply = redis_client.execute_command(*_knn_args(q_vector, top_k, prefilter))
+        return reciprocal_rank_fusion([_parse_search_reply(knn_reply)], top_k)
+
+    pipe = redis_client.pipeline(transaction = False)
+    pipe.execute_command(*text_args)
+    pipe.execute_command(*_knn_args(q_vector, candidates, prefilter))
+    text_reply, knn_reply = pipe.execute()
+
+    return reciprocal_rank_fusion(
+        [_parse_search_reply(text_reply), _parse_search_reply(knn_reply)], top_k
+    )
 
 if __name__ == "__main__":
     # 测试用例：模拟用户提问
     test_question = "为什么会出现无法下单的情况？"
     search_faq(test_question, top_k=3)
 
+    # 批量检索：离线评测时一次送入一批问题
+    eval_questions = ["为什么会出现无法下单的情况？", "怎么查看退款是否成功？"]
+    for q, docs in zip(eval_questions, search_faq_batch(eval_questions, top_k=3)):
+        print(f"{q} -> {[doc.question for doc in docs]}")
+
+    # 混合检索：关键词 + 向量，限定在 “支付问题” 类别内
+    for doc in search_faq_hybrid("一天最多提交几次订单", top_k=3, category="支付问题"):
+        print(f"RRF={doc.rrf_score:.4f}  Q: {doc.question}")
+
 """
 🔎 用户问题: 为什么会出现无法下单的情况？
 📊 召回 3 条结果
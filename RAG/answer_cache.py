@@ -0,0 +1,133 @@
+# 语义答案缓存：问题向量足够接近就直接复用之前的大模型回答，不再调用 LLM
+import os
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+
+CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # 余弦相似度阈值
+CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))                # 过期时间（秒）
+CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000")) # 最多缓存多少条回答
+
+
+class SemanticCache:
+    """
+    以问题向量为 key 的答案缓存
+
+    所有缓存问题的归一化向量放在一块预分配的矩阵里，查找时一次矩阵-向量乘法
+    找出最相似的问题，余弦相似度不低于 threshold 且未过期就算命中。
+    容量满了按 LRU 淘汰；每条答案记录它引用的 FAQ key，
+    FAQ 变化时可以按 key 精确失效，索引版本号变化时整体清空。
+
+    Args:
+        threshold (float): 命中所需的最小余弦相似度
+        ttl (int): 每条答案的存活时间（秒）
+        max_entries (int): 缓存容量
+    """
+
+    def __init__(self, threshold: float = CACHE_THRESHOLD, ttl: int = CACHE_TTL,
+                 max_entries: int = CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self._vectors = None                 # (max_entries, dim)，第一次写入时按维度分配
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._created = np.zeros(max_entries, dtype=np.float64)  # 每个槽位的写入时间，用来批量判断过期
+        self._entries = {}                   # 槽位号 -> {"question", "answer", "doc_keys", "created_at"}
+        self._lru = OrderedDict()            # 槽位号按最近使用排序，最前面的最久没用
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, slot: int):
+        self._valid[slot] = False
+        self._entries.pop(slot, None)
+        self._lru.pop(slot, None)
+
+    def get(self, question_vector):
+        """
+        查找语义相近的已缓存问题；比较之前先把已过期的槽位全部失效，
+        最相近的条目过期时不会挡住次相近的有效条目
+
+        Returns:
+            dict | None: 命中时返回 {"question", "answer", "doc_keys", "similarity"}，否则 None
+        """
+        with self._lock:
+            if self._vectors is not None:
+                expired = np.flatnonzero(self._valid & (time.time() - self._created > self.ttl))
+                for slot in expired:
+                    self._remove(int(slot))
+            if self._vectors is None or not self._valid.any():
+                self.misses += 1
+                return None
+            query = self._normalize(question_vector)
+            scores = self._vectors @ query
+            scores[~self._valid] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+            entry = self._entries[slot]
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            return {**entry, "similarity": float(scores[slot])}
+
+    def put(self, question_vector, question: str, answer: str, doc_keys: list = ()):
+        """缓存一条回答；doc_keys 是生成这条回答时用到的 FAQ key"""
+        with self._lock:
+            vector = self._normalize(question_vector)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            if len(self._lru) >= self.max_entries:
+                slot, _ = self._lru.popitem(last=False)  # 淘汰最久没用的
+                self._remove(slot)
+            else:
+                slot = int(np.argmin(self._valid))       # 第一个空槽
+            now = time.time()
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._created[slot] = now
+            self._entries[slot] = {
+                "question": question,
+                "answer": answer,
+                "doc_keys": set(doc_keys),
+                "created_at": now,
+            }
+            self._lru[slot] = None
+
+    def invalidate_docs(self, doc_keys) -> int:
+        """引用了这些 FAQ 的回答全部失效，返回失效条数"""
+        doc_keys = set(doc_keys)
+        with self._lock:
+            stale = [slot for slot, entry in self._entries.items() if entry["doc_keys"] & doc_keys]
+            for slot in stale:
+                self._remove(slot)
+        return len(stale)
+
+    def sync_version(self, version) -> bool:
+        """索引版本号变了（FAQ 有增删改）就清空缓存，返回是否发生了清空"""
+        with self._lock:
+            if version == self.version:
+                return False
+            cleared = self.version is not None
+            self.version = version
+            if cleared:
+                for slot in list(self._entries):
+                    self._remove(slot)
+            return cleared
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+        }
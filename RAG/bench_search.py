@@ -0,0 +1,92 @@
+# 检索延迟对比：RediSearch KNN vs 本地精确检索 vs 本地 IVF
+import time
+import redis
+import numpy as np
+from redis.commands.search.query import Query
+from local_search import LocalVectorIndex
+from Embedding_model import encode_vector
+
+INDEX_NAME = "faq_index"
+TOP_K = 3
+N_QUERIES = 200          # 查询次数
+SYNTHETIC_SIZE = 50_000  # 连不上 Redis 时用随机向量测本地检索
+SYNTHETIC_DIM = 1024
+
+
+def percentile_ms(latencies: list, p: float) -> float:
+    return float(np.percentile(latencies, p) * 1000)
+
+
+def report(name: str, latencies: list):
+    print(f"{name:<12} p50={percentile_ms(latencies, 50):.3f}ms  "
+          f"p95={percentile_ms(latencies, 95):.3f}ms  "
+          f"qps={len(latencies) / sum(latencies):.0f}")
+
+
+def bench_local(index: LocalVectorIndex, queries: np.ndarray, nprobe: int):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        docs = index.search(q, TOP_K, nprobe=nprobe)
+        latencies.append(time.perf_counter() - start)
+        results.append([d.id for d in docs])
+    return latencies, results
+
+
+def bench_redis(client, queries: np.ndarray):
+    query = (
+        Query(f"*=>[KNN {TOP_K} @embedding $vec AS score]")
+        .sort_by("score")
+        .return_fields("question", "score")
+        .dialect(2)
+    )
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        client.ft(INDEX_NAME).search(query, query_params={"vec": encode_vector(q)})
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def recall(truth: list, approx: list) -> float:
+    """近似结果中命中精确 top-k 的比例"""
+    hit = sum(len(set(t) & set(a)) for t, a in zip(truth, approx))
+    return hit / sum(len(t) for t in truth)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    client = redis.Redis(host="localhost", port=6379, decode_responses=False)
+    try:
+        client.ping()
+        index = LocalVectorIndex.from_redis(client)
+    except redis.ConnectionError:
+        client = None
+        print(f"⚠️ 连不上 Redis，使用 {SYNTHETIC_SIZE} 条随机向量只测本地检索")
+        vectors = rng.standard_normal((SYNTHETIC_SIZE, SYNTHETIC_DIM), dtype=np.float32)
+        index = LocalVectorIndex(vectors, [{} for _ in range(SYNTHETIC_SIZE)],
+                                 [f"faq:{i}" for i in range(SYNTHETIC_SIZE)])
+    if len(index) == 0:
+        raise SystemExit("❌ Redis 中没有 FAQ 向量，请先运行 Embedding_model.py 导入数据再测")
+
+    # 用库里的向量加一点噪声当查询，模拟“相似但不完全相同”的问题
+    picks = rng.choice(len(index), N_QUERIES)
+    queries = index.vectors[picks] + rng.normal(0, 0.01, (N_QUERIES, index.vectors.shape[1]))
+    print(f"📊 {len(index)} 条向量, {N_QUERIES} 次查询, top_k={TOP_K}\n")
+
+    exact_lat, exact_ids = bench_local(index, queries, nprobe=0)
+    report("local-exact", exact_lat)
+
+    start = time.perf_counter()
+    batch_ids = [[d.id for d in docs] for docs in index.search_batch(queries, TOP_K)]
+    batch_elapsed = time.perf_counter() - start
+    print(f"{'local-batch':<12} {N_QUERIES} 条共 {batch_elapsed * 1000:.3f}ms  "
+          f"qps={N_QUERIES / batch_elapsed:.0f}  recall@{TOP_K} vs exact = {recall(exact_ids, batch_ids):.3f}")
+
+    index.build_ivf()
+    ivf_lat, ivf_ids = bench_local(index, queries, nprobe=8)
+    report("local-ivf", ivf_lat)
+    print(f"{'':<12} recall@{TOP_K} vs exact = {recall(exact_ids, ivf_ids):.3f}")
+
+    if client is not None:
+        report("redis-knn", bench_redis(client, queries))
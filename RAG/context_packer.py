@@ -0,0 +1,112 @@
+# 上下文打包：在 token 预算内按相关度挑选、去重、截断召回的 FAQ，控制 prompt 长度
+import re
+
+CONTEXT_TOKEN_BUDGET = 800   # 文档片段部分默认的 token 预算
+DEDUPE_THRESHOLD = 0.85      # 两条 FAQ 字符二元组 Jaccard 相似度超过该值视为重复
+FRAGMENT_OVERHEAD = 12       # 每个片段的 “【文档片段i】 Q: A:” 等格式开销（估算）
+MIN_ANSWER_TOKENS = 16       # 截断后答案太短就不如不要
+
+# 预编译正则：中日韩字符和全角标点按 1 token 估算，英文/数字按词估算
+_CJK = "\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef"
+_CJK_RE = re.compile(f"[{_CJK}]")
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_OTHER_RE = re.compile(rf"[^\sA-Za-z0-9_{_CJK}]")
+# 句子结束位置（标点之后）
+_SENTENCE_END_RE = re.compile(r"[。！？!?；;\n]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地快速估算 token 数，不依赖具体模型的分词器：
+    每个中文字符约 1 token，英文单词约每 4 个字母 1 token，其余符号各 1 token
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    words = sum(len(w) // 4 + 1 for w in _WORD_RE.findall(text))
+    other = len(_OTHER_RE.findall(text))
+    return cjk + words + other
+
+
+def _bigrams(text: str) -> set:
+    text = re.sub(r"\s+", "", text)
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def truncate_to_sentences(text: str, budget: int) -> str:
+    """在句子边界截断文本，保证结果的估算 token 数不超过 budget；一句都放不下时返回空串"""
+    if estimate_tokens(text) <= budget:
+        return text
+    used = 0
+    end = 0
+    # 逐句累加 token，只扫描一遍
+    for match in _SENTENCE_END_RE.finditer(text):
+        sentence_tokens = estimate_tokens(text[end:match.end()])
+        if used + sentence_tokens > budget:
+            break
+        used += sentence_tokens
+        end = match.end()
+    return text[:end].rstrip()
+
+
+def pack_context(docs, budget: int = CONTEXT_TOKEN_BUDGET,
+                 dedupe_threshold: float = DEDUPE_THRESHOLD, report: dict = None) -> list:
+    """
+    按相关度从高到低贪心地把文档装进 token 预算：
+    近似重复的 Q/A 只保留最相关的一条；放不下整条答案时在句子边界截断。
+
+    参数:
+        docs (list): 召回的文档对象，需要有 question、answer，且已按相关度从高到低排列
+            （KNN、混合检索等各检索函数的返回顺序即是如此）。
+        budget (int): 文档片段部分可用的 token 数。
+        dedupe_threshold (float): 判定为近似重复的相似度阈值。
+        report (dict): 可选，传入后会写入 naive_tokens（原样拼接的开销）、used_tokens、
+            saved_tokens、deduped、truncated、dropped。
+
+    返回:
+        list[tuple]: (doc, answer) 列表，answer 可能是截断后的文本。
+    """
+    packed, kept_grams = [], []
+    used = naive = 0
+    deduped = truncated = dropped = 0
+
+    for doc in docs:
+        q_tokens = estimate_tokens(doc.question)
+        a_tokens = estimate_tokens(doc.answer)
+        full = FRAGMENT_OVERHEAD + q_tokens + a_tokens
+        naive += full
+
+        grams = _bigrams(doc.question + doc.answer)
+        if any(_jaccard(grams, g) >= dedupe_threshold for g in kept_grams):
+            deduped += 1
+            continue
+
+        remaining = budget - used
+        if full <= remaining:
+            packed.append((doc, doc.answer))
+            used += full
+        else:
+            answer_budget = remaining - FRAGMENT_OVERHEAD - q_tokens
+            answer = truncate_to_sentences(doc.answer, answer_budget) if answer_budget >= MIN_ANSWER_TOKENS else ""
+            if not answer:
+                dropped += 1
+                continue
+            packed.append((doc, answer))
+            used += FRAGMENT_OVERHEAD + q_tokens + estimate_tokens(answer)
+            truncated += 1
+        kept_grams.append(grams)
+
+    if report is not None:
+        report.update({
+            "naive_tokens": naive,
+            "used_tokens": used,
+            "saved_tokens": naive - used,
+            "deduped": deduped,
+            "truncated": truncated,
+            "dropped": dropped,
+        })
+    return packed
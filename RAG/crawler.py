@@ -0,0 +1,429 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import aiohttp
+from datetime import datetime
+from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
+
+# 注意：本文件原名 playwright.py，会遮蔽同名的 playwright 包导致无法导入，故改名为 crawler.py
+
+FAQ_SELECTOR = "#faq-list"   # FAQ 列表所在的元素
+PAGE_TIMEOUT = 30_000        # 单页加载超时（毫秒）
+CRAWL_CONCURRENCY = 8        # 并发抓取的页面数（页面池大小）
+BLOCKED_RESOURCES = {"image", "font", "media"}  # 只要文本，这些资源直接拦截不下载
+CRAWL_OUTPUT_DIR = "faq_pages"                  # 每个 URL 的抓取结果保存目录
+CRAWL_CHECKPOINT = "crawl_checkpoint.jsonl"     # 抓取进度，每完成一页追加一行
+CRAWL_STATE_FILE = "crawl_state.json"           # 每个 URL 的 ETag / Last-Modified / 内容哈希，跨次运行保留
+CHANGE_MANIFEST = "crawl_manifest.json"         # 本次抓取的变化清单，下游只需处理其中 changed 的页面
+PROBE_TIMEOUT = 10           # 条件请求（HEAD / 条件 GET）的超时（秒）
+# 模拟常见浏览器的用户代理
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/139.0.0.0 Safari/537.36 Edg/139.0.0.0"
+)
+# 设置HTTP请求头中的语言偏好
+EXTRA_HEADERS = {"Accept-Language": "zh-CN,zh;q=0.9"}
+
+def collect_faq(url):
+    """
+    收集指定URL页面中的FAQ内容
+
+    参数：
+        url(str): 目标网页URL网址
+
+    返回：
+        str: 提取的FAQ内容
+    """
+    # 启动playwright浏览器自动化工具
+    with sync_playwright() as p:
+        # 启动Chrome浏览器，设置为非无头模式并指定中文语言
+        browser = p.chromium.launch(
+            headless = False, # 非无头模式,可视化浏览器操作
+            args = ['--lang=zh-CN'] # 浏览器语言设置为中文
+        )
+        # 创建新页面，配置中文环境
+        page = browser.new_page(
+            locale = 'zh-CN', # 页面语言环境设置为中文
+            user_agent = USER_AGENT,
+            extra_http_headers = EXTRA_HEADERS
+        )
+        # 访问目标URL并等待页面加载完成
+        page.goto(url, timeout=PAGE_TIMEOUT)
+        page.wait_for_load_state("networkidle") # 等待网络空闲，确保页面加载完成
+
+        # 提取FAQ列表区域的文本内容
+        raw_text = page.locator(FAQ_SELECTOR).first.text_content() # 找到id="faq-list"的元素并获取第一个的文本内容
+        # 关闭浏览器
+        browser.close()
+        return raw_text
+
+# 保存文件
+def save_faq(cleaned_text: str, output_file: str) -> bool:
+    """
+    将FAQ文本内容保存到指定文件；内容与已有文件相同时不重写，
+    文件修改时间不变，下游清洗/向量化也就不会被触发
+
+    参数:
+        cleaned_text (str): 要保存的FAQ文本内容
+        output_file (str): 输出文件路径
+
+    返回:
+        bool: 是否真正写入了文件
+    """
+    if os.path.exists(output_file):
+        with open(output_file, "r", encoding="utf-8") as f:
+            if f.read() == cleaned_text:
+                print(f"FAQ内容未变化，跳过写入 {output_file}")
+                return False
+    # 写入文件
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(cleaned_text)
+    print(f"FAQ内容已保存到 {output_file}")
+    return True
+
+def text_hash(text: str) -> str:
+    """抽取出的 FAQ 文本的内容指纹"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _load_json(path: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _dump_json(path: str, data):
+    """先写临时文件再原子替换，避免写一半崩溃留下坏文件"""
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, path)
+
+def page_file(url: str, output_dir: str = CRAWL_OUTPUT_DIR) -> str:
+    """每个 URL 对应一个固定的输出文件名，重跑会覆盖而不是重复"""
+    return os.path.join(output_dir, hashlib.sha1(url.encode("utf-8")).hexdigest()[:16] + ".txt")
+
+def load_crawl_checkpoint(checkpoint_file: str = CRAWL_CHECKPOINT) -> dict:
+    """
+    读取抓取进度，返回 {url: 记录}；同一个 URL 有多条记录时以最后一条为准。
+    最后一行可能是崩溃时写了一半的，解析失败直接忽略。
+    """
+    done = {}
+    if not os.path.exists(checkpoint_file):
+        return done
+    with open(checkpoint_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[record["url"]] = record
+    return done
+
+async def _block_heavy_resources(route):
+    """图片、字体、音视频请求直接中止，其余照常发出"""
+    if route.request.resource_type in BLOCKED_RESOURCES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+def _same_validators(headers, known: dict) -> bool:
+    """响应头里的 ETag 或 Last-Modified 与上次记录的一致"""
+    etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+    return bool((etag and etag == known.get("etag"))
+                or (last_modified and last_modified == known.get("last_modified")))
+
+async def _probe_unchanged(session: aiohttp.ClientSession, url: str, known: dict) -> bool:
+    """
+    不开浏览器，先用带 If-None-Match / If-Modified-Since 的 HEAD 请求判断页面是否没变；
+    服务器不支持 HEAD 时退回条件 GET。返回 True 表示可以跳过渲染。
+    """
+    headers = {}
+    if known.get("etag"):
+        headers["If-None-Match"] = known["etag"]
+    if known.get("last_modified"):
+        headers["If-Modified-Since"] = known["last_modified"]
+    if not headers:
+        return False
+    try:
+        async with session.head(url, headers=headers, allow_redirects=True) as resp:
+            if resp.status == 304:
+                return True
+            if resp.status < 400:
+                return _same_validators(resp.headers, known)
+        async with session.get(url, headers=headers) as resp:
+            return resp.status == 304 or (resp.status < 400 and _same_validators(resp.headers, known))
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return False
+
+def _log_record(record: dict, progress: dict, checkpoint):
+    """把一页的处理结果追加到进度文件并打印耗时"""
+    checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+    checkpoint.flush()
+    progress["done"] += 1
+    url = record["url"]
+    if record.get("skipped"):
+        print(f"⏭️ [{progress['done']}/{progress['total']}] {url} {record['total_ms']}ms（条件请求确认未变化）")
+    elif record["status"] == "ok":
+        print(f"✅ [{progress['done']}/{progress['total']}] {url} {record['total_ms']}ms"
+              f"（加载 {record['goto_ms']}ms，提取 {record['extract_ms']}ms"
+              f"{'' if record.get('changed', True) else '，内容未变化'}）")
+    else:
+        print(f"❌ [{progress['done']}/{progress['total']}] {url} {record['total_ms']}ms {record['error']}")
+    progress["records"].append(record)
+
+async def _probe_and_log(session: aiohttp.ClientSession, url: str, known: dict, output_dir: str,
+                         semaphore: asyncio.Semaphore, progress: dict, checkpoint) -> bool:
+    """探测一个 URL，确认未变化时直接记一条跳过记录，返回是否跳过"""
+    output_file = page_file(url, output_dir)
+    start = time.perf_counter()
+    async with semaphore:
+        unchanged = os.path.exists(output_file) and await _probe_unchanged(session, url, known)
+    if unchanged:
+        _log_record({
+            "url": url, "file": output_file, "status": "ok", "changed": False, "skipped": "http",
+            "etag": known.get("etag"), "last_modified": known.get("last_modified"),
+            "content_hash": known.get("content_hash"),
+            "total_ms": round((time.perf_counter() - start) * 1000, 1),
+        }, progress, checkpoint)
+    return unchanged
+
+async def _crawl_worker(page, queue: asyncio.Queue, progress: dict, state: dict,
+                        selector: str, output_dir: str, checkpoint, timeout: int):
+    """
+    一个 worker 独占页面池中的一个页面，循环从队列取 URL 渲染抽取，
+    再按内容哈希判断是否真的变了，只有变了才写文件
+    """
+    while True:
+        url = await queue.get()
+        start = time.perf_counter()
+        known = state.get(url, {})
+        output_file = page_file(url, output_dir)
+        record = {"url": url, "file": output_file}
+        try:
+            # 只等 DOM 就绪和目标元素出现，不等 networkidle（统计、长连接会让它迟迟不触发）
+            response = await page.goto(url, wait_until="domcontentloaded", timeout=timeout)
+            loaded = time.perf_counter()
+            locator = page.locator(selector).first
+            await locator.wait_for(timeout=timeout)
+            raw_text = await locator.text_content() or ""
+            digest = text_hash(raw_text)
+            changed = digest != known.get("content_hash") or not os.path.exists(output_file)
+            if changed:
+                save_faq(raw_text, output_file)
+            headers = response.headers if response is not None else {}
+            record.update(status="ok", changed=changed, chars=len(raw_text), content_hash=digest,
+                          etag=headers.get("etag"), last_modified=headers.get("last-modified"),
+                          goto_ms=round((loaded - start) * 1000, 1),
+                          extract_ms=round((time.perf_counter() - loaded) * 1000, 1))
+        except Exception as e:
+            record.update(status="error", error=f"{type(e).__name__}: {e}".splitlines()[0])
+        record["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        _log_record(record, progress, checkpoint)
+        queue.task_done()
+
+def _finish_crawl(urls: list[str], state: dict, checkpoint_file: str, state_file: str, manifest_file: str) -> dict:
+    """
+    汇总进度文件（包括断点之前的记录）：更新每个 URL 的 ETag/Last-Modified/内容哈希，
+    生成变化清单；全部成功时删除进度文件，下次运行从头做条件检查。
+    有失败时进度文件保留给下次断点续抓，但其中已写进本次清单的变化标记会清掉，
+    避免下次运行把这些页面再报一遍 changed
+    """
+    records = load_crawl_checkpoint(checkpoint_file)
+    manifest = {"generated_at": datetime.now().isoformat(timespec="seconds"),
+                "changed": [], "unchanged": [], "failed": []}
+    for url in dict.fromkeys(urls):
+        record = records.get(url)
+        if record is None or record["status"] != "ok":
+            manifest["failed"].append({"url": url, "error": (record or {}).get("error", "未抓取")})
+            continue
+        if record.get("changed", True):
+            change = "updated" if url in state else "added"
+            manifest["changed"].append({"url": url, "file": record["file"], "change": change})
+        else:
+            manifest["unchanged"].append(url)
+        state[url] = {
+            "etag": record.get("etag"),
+            "last_modified": record.get("last_modified"),
+            "content_hash": record.get("content_hash"),
+            "file": record["file"],
+            "checked_at": manifest["generated_at"],
+        }
+    _dump_json(state_file, state)
+    _dump_json(manifest_file, manifest)
+    if not manifest["failed"]:
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+    elif records:
+        tmp_file = checkpoint_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for record in records.values():
+                if record["status"] == "ok":
+                    record["changed"] = False
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_file, checkpoint_file)
+    return manifest
+
+async def crawl_faq_async(
+    urls: list[str],
+    concurrency: int = CRAWL_CONCURRENCY,
+    output_dir: str = CRAWL_OUTPUT_DIR,
+    checkpoint_file: str = CRAWL_CHECKPOINT,
+    state_file: str = CRAWL_STATE_FILE,
+    manifest_file: str = CHANGE_MANIFEST,
+    selector: str = FAQ_SELECTOR,
+    timeout: int = PAGE_TIMEOUT,
+    headless: bool = True
+) -> dict:
+    """
+    并发抓取多个 FAQ 页面，分两步：
+    1. 对上次抓过的 URL 用 aiohttp 发条件请求（ETag / Last-Modified），304 或校验值相同就跳过；
+    2. 剩下的页面交给一个无头浏览器渲染：concurrency 个页面组成页面池，拦截图片/字体/媒体请求，
+       抽取出的文本与上次的内容哈希相同也不写文件。每页结果保存为 output_dir 下的一个文本文件。
+
+    进度逐行追加到 checkpoint_file，中断后重跑会跳过已经处理成功的 URL，失败的会重试。
+    结束后更新 state_file，并把本次新增/变化/未变化/失败的页面写进 manifest_file。
+
+    参数:
+        urls (list[str]): 待抓取的页面地址。
+        concurrency (int): 同时打开的页面数。
+        output_dir (str): 抓取结果目录。
+        checkpoint_file (str): 进度文件路径。
+        state_file (str): 每个 URL 的校验值记录。
+        manifest_file (str): 变化清单输出路径。
+        selector (str): FAQ 内容所在元素的选择器。
+        timeout (int): 单页加载/等待元素的超时（毫秒）。
+        headless (bool): 是否无头运行。
+
+    返回:
+        dict: 变化清单，包含 changed（url、file、change=added/updated）、unchanged、failed。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = _load_json(state_file, {})
+    finished = {url for url, r in load_crawl_checkpoint(checkpoint_file).items() if r["status"] == "ok"}
+    todo = list(dict.fromkeys(url for url in urls if url not in finished))
+    if finished:
+        print(f"⏩ 从断点继续，跳过已完成的 {len(set(urls) & finished)} 个页面")
+
+    progress = {"done": 0, "total": len(todo), "records": []}
+    start = time.perf_counter()
+
+    with open(checkpoint_file, "a", encoding="utf-8") as checkpoint:
+        # 第一步：条件请求，不需要浏览器
+        session_headers = {"User-Agent": USER_AGENT, **EXTRA_HEADERS}
+        async with aiohttp.ClientSession(headers=session_headers,
+                                         timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT)) as session:
+            semaphore = asyncio.Semaphore(concurrency * 4)
+            skipped = await asyncio.gather(*(
+                _probe_and_log(session, url, state.get(url, {}), output_dir, semaphore, progress, checkpoint)
+                for url in todo
+            ))
+        to_render = [url for url, skip in zip(todo, skipped) if not skip]
+
+        # 第二步：只有可能变化的页面才启动浏览器渲染
+        if to_render:
+            queue = asyncio.Queue()
+            for url in to_render:
+                queue.put_nowait(url)
+            async with async_playwright() as p:
+                browser = await p.chromium.launch(headless=headless, args=["--lang=zh-CN"])
+                # 所有页面共用一个上下文：共享 cookie 和缓存，只拦截一次资源
+                context = await browser.new_context(
+                    locale="zh-CN", user_agent=USER_AGENT, extra_http_headers=EXTRA_HEADERS
+                )
+                await context.route("**/*", _block_heavy_resources)
+                pages = [await context.new_page() for _ in range(min(concurrency, len(to_render)))]
+                workers = [
+                    asyncio.create_task(_crawl_worker(page, queue, progress, state, selector, output_dir,
+                                                      checkpoint, timeout))
+                    for page in pages
+                ]
+                await queue.join()
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                await browser.close()
+
+    manifest = _finish_crawl(urls, state, checkpoint_file, state_file, manifest_file)
+    elapsed = time.perf_counter() - start
+    print(f"🎉 抓取完成：{len(todo)} 页中 {len(todo) - len(to_render)} 页经条件请求跳过，渲染 {len(to_render)} 页，"
+          f"耗时 {elapsed:.2f}s")
+    print(f"📝 变化清单 {manifest_file}：变化 {len(manifest['changed'])}，"
+          f"未变化 {len(manifest['unchanged'])}，失败 {len(manifest['failed'])}")
+    return manifest
+
+def crawl_faq(urls: list[str], **kwargs) -> dict:
+    """crawl_faq_async 的同步入口"""
+    return asyncio.run(crawl_faq_async(urls, **kwargs))
+
+def _serve_demo_site(n_pages: int = 50, port: int = 8765):
+    """
+    在临时目录生成 n_pages 个带 #faq-list 的静态页面，并在后台线程用 http.server 提供服务，
+    用来在本地验证并发抓取、断点续传和条件请求，不依赖外网。
+    目录和端口固定、已有页面不重写，第二次运行时 Last-Modified 不变，应全部被 304 跳过
+
+    返回:
+        list[str]: 各页面的 URL。
+    """
+    import tempfile
+    import threading
+    import functools
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    root = os.path.join(tempfile.gettempdir(), "faq_demo_site")
+    os.makedirs(root, exist_ok=True)
+    for i in range(n_pages):
+        if os.path.exists(os.path.join(root, f"faq{i}.html")):
+            continue
+        with open(os.path.join(root, f"faq{i}.html"), "w", encoding="utf-8") as f:
+            f.write(
+                f"<html><body><img src='banner{i}.png'><div id='faq-list'>"
+                f"<h3>常见问题 {i}</h3><p>Q：第 {i} 页的问题？</p><p>第 {i} 页的答案。</p>"
+                f"</div></body></html>"
+            )
+
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):  # 不打印访问日志
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), functools.partial(QuietHandler, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return [f"http://127.0.0.1:{port}/faq{i}.html" for i in range(n_pages)]
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--local":
+        # 本地静态站点自测：python crawler.py --local
+        crawl_faq(_serve_demo_site(), output_dir="faq_pages_local", checkpoint_file="crawl_checkpoint_local.jsonl",
+                  state_file="crawl_state_local.json", manifest_file="crawl_manifest_local.json")
+    elif len(sys.argv) > 1:
+        # 批量抓取：python crawler.py urls.txt（每行一个 URL）
+        with open(sys.argv[1], "r", encoding="utf-8") as f:
+            crawl_faq([line.strip() for line in f if line.strip()])
+    else:
+        cleaned_text = collect_faq(url="https://waimai.meituan.com/help/faq")
+        output_file = "faq.txt"
+        save_faq(cleaned_text, output_file)
+
+"""
+# head -n 20 faq.txt           
+          在线支付问题
+          
+        
+        
+          
+            Q：在线支付取消订单后钱怎么返还？
+            
+              订单取消后，款项会在一个工作日内，直接返还到您的美团账户余额。
+            
+          
+        
+        
+          
+            Q：怎么查看退款是否成功？
+            
+              退款会在一个工作日之内到美团账户余额，可在“账号管理——我的账号”中查看是否到账
+"""
\ No newline at end of file
@@ -0,0 +1,159 @@
+# 近似重复 FAQ 去重：MinHash 签名 + LSH 分桶，在 text_manage 之后、Embedding_model 之前运行
+import re
+import sys
+import json
+import time
+import zlib
+import numpy as np
+from text_manage import iter_faq_docs
+
+NUM_PERM = 128           # MinHash 签名长度（哈希函数个数）
+LSH_BANDS = 16           # 分成多少个 band，每个 band NUM_PERM // LSH_BANDS 行；band 全相同才成为候选
+DEDUP_THRESHOLD = 0.8    # 签名估计的 Jaccard 相似度不低于该值才判为重复
+SHINGLE_SIZE = 3         # 字符 n-gram 长度，中文按字切分
+_PRIME = (1 << 61) - 1   # 通用哈希的模数（梅森素数），乘积在 uint64 内不会溢出
+_NORMALIZE_RE = re.compile(r"[\W_]+")  # 去掉空白和标点，只比较文字本身
+
+
+def _shingles(text: str) -> np.ndarray:
+    """归一化后取字符 n-gram，用 crc32 哈希成整数（跨进程稳定，不受 PYTHONHASHSEED 影响）"""
+    text = _NORMALIZE_RE.sub("", text.lower())
+    if len(text) <= SHINGLE_SIZE:
+        grams = {text}
+    else:
+        grams = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHashLSH:
+    """
+    MinHash + LSH 近似重复检测
+
+    每条文本的签名是 NUM_PERM 个随机哈希函数在其 shingle 集合上的最小值，
+    两条签名逐位相等的比例就是 Jaccard 相似度的估计。
+    签名切成 bands 段，任意一段完全相同就进入同一个桶成为候选，
+    候选再用签名估计的相似度复核，用并查集合并成簇。
+    每条文本只做常数次桶操作，整体时间近似线性。
+
+    Args:
+        num_perm (int): 签名长度
+        bands (int): LSH 分段数，需整除 num_perm
+        threshold (float): 判为重复的最小估计相似度
+        seed (int): 随机哈希参数的种子
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = LSH_BANDS,
+                 threshold: float = DEDUP_THRESHOLD, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"签名长度 {num_perm} 不能被 band 数 {bands} 整除")
+        rng = np.random.default_rng(seed)
+        # h(x) = (a*x + b) mod p，a、b < 2^32，x 为 32 位 crc，乘积不超过 2^64
+        self.a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.signatures = []
+        self._buckets = [{} for _ in range(bands)]
+        self._parent = []
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = _shingles(text)
+        hashed = (self.a[:, None] * shingles[None, :] + self.b[:, None]) % _PRIME
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def _find(self, i: int) -> int:
+        while self._parent[i] != i:
+            self._parent[i] = self._parent[self._parent[i]]  # 路径压缩
+            i = self._parent[i]
+        return i
+
+    def add(self, text: str) -> int:
+        """
+        加入一条文本并立即与同桶的代表比较，返回它的编号。
+        每个桶只保留第一条作为代表，避免热门桶里两两比较退化成平方复杂度。
+        """
+        idx = len(self.signatures)
+        sig = self.signature(text)
+        self.signatures.append(sig)
+        self._parent.append(idx)
+        for band, buckets in enumerate(self._buckets):
+            key = sig[band * self.rows:(band + 1) * self.rows].tobytes()
+            rep = buckets.setdefault(key, idx)
+            if rep != idx and self._find(rep) != self._find(idx):
+                if np.mean(self.signatures[rep] == sig) >= self.threshold:
+                    self._parent[self._find(idx)] = self._find(rep)
+        return idx
+
+    def clusters(self) -> list[list[int]]:
+        """返回每个簇的成员编号（按编号升序），单条不重复的也各自成簇"""
+        groups = {}
+        for i in range(len(self._parent)):
+            groups.setdefault(self._find(i), []).append(i)
+        return sorted(groups.values(), key=lambda members: members[0])
+
+
+def _dedup_text(doc: dict) -> str:
+    """参与去重比较的文本：问题 + 答案"""
+    return doc["question"] + " " + doc["answer"]
+
+
+def dedup_file(input_path: str, output_path: str, threshold: float = DEDUP_THRESHOLD) -> dict:
+    """
+    对 process_faq / process_faq_dir 的输出去重，结果写成新的 JSONL：
+    每个近似重复簇只保留一条答案最长的作为代表（同样长取最早出现的），
+    metadata 中追加 sources / categories，列出簇内所有来源和分类。
+
+    输入读两遍：第一遍只保存签名和来源，第二遍逐条写出代表，内存里不放 FAQ 正文。
+
+    参数:
+        input_path (str): JSONL 文件或分片目录。
+        output_path (str): 去重后的 JSONL 文件。
+        threshold (float): 判为重复的最小估计 Jaccard 相似度。
+
+    返回:
+        dict: total、kept、removed、clusters（含 2 条以上成员的簇数）、seconds。
+    """
+    start = time.perf_counter()
+    lsh = MinHashLSH(threshold=threshold)
+    sources, categories, answer_lengths = [], [], []
+    for doc in iter_faq_docs(input_path):
+        lsh.add(_dedup_text(doc))
+        sources.append(doc["metadata"]["source"])
+        categories.append(doc["metadata"]["category"])
+        answer_lengths.append(len(doc["answer"]))
+
+    canonical = {}  # 代表的编号 -> 簇成员
+    for members in lsh.clusters():
+        best = max(members, key=lambda i: (answer_lengths[i], -i))
+        canonical[best] = members
+
+    with open(output_path, "w", encoding="utf-8") as fout:
+        for idx, doc in enumerate(iter_faq_docs(input_path)):
+            members = canonical.get(idx)
+            if members is None:
+                continue
+            if len(members) > 1:
+                doc["metadata"]["sources"] = sorted({sources[i] for i in members})
+                doc["metadata"]["categories"] = sorted({categories[i] for i in members})
+            fout.write(json.dumps(doc, ensure_ascii=False) + "\n")
+
+    total = len(sources)
+    summary = {
+        "total": total,
+        "kept": len(canonical),
+        "removed": total - len(canonical),
+        "clusters": sum(len(m) > 1 for m in canonical.values()),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+    print(f"🧹 去重完成: {summary}，结果保存到 {output_path}")
+    return summary
+
+
+if __name__ == "__main__":
+    # python dedup.py [输入 JSONL 或分片目录] [输出 JSONL]
+    dedup_file(
+        sys.argv[1] if len(sys.argv) > 1 else "faq_processed.jsonl",
+        sys.argv[2] if len(sys.argv) > 2 else "faq_dedup.jsonl",
+    )
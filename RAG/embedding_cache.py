@@ -0,0 +1,182 @@
+# 向量缓存：按 “模型名 + 文本” 的哈希做内容寻址，同样的文本只向模型要一次向量
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")  # 缓存文件位置
+CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))  # 最多缓存多少条向量
+
+
+class EmbeddingCache:
+    """
+    持久化的向量缓存
+
+    向量以 float32 二进制（1024 维 = 4096 字节）存进 SQLite，
+    每次命中都会刷新 last_used，条数超过 max_entries 时按 LRU 淘汰最久没用过的。
+    同时统计命中/未命中次数，方便观察缓存效果。
+
+    Args:
+        path (str): SQLite 缓存文件路径
+        max_entries (int): 最多保留的向量条数
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # 同一个缓存可能被多个线程共用（例如服务模式），所有读写都加锁
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """模型名和文本一起做 sha256，换模型后旧向量自然不会被误用"""
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: list[str]) -> list:
+        """
+        批量查缓存
+
+        Returns:
+            list[np.ndarray | None]: 与 texts 一一对应，未命中的位置为 None
+        """
+        keys = [self.make_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            # SQLite 单条语句的参数个数有限，分段查询
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            results = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(np.frombuffer(blob, dtype=np.float32))
+        return results
+
+    def put_many(self, model: str, texts: list[str], vectors: list):
+        """批量写入缓存，超出容量时按 LRU 淘汰"""
+        now = time.time()
+        rows = [
+            (self.make_key(model, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._count += self._conn.total_changes - before
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,)
+                )
+                self._count -= overflow
+            self._conn.commit()
+
+    def embed(self, model: str, texts: list[str], embed_fn) -> list:
+        """
+        先查缓存，只把未命中的文本（去重后）交给 embed_fn 编码，再写回缓存
+
+        Args:
+            model (str): 模型名，参与缓存 key 的计算
+            texts (list[str]): 待编码文本
+            embed_fn (callable): 接收 list[str]，返回对应向量列表的函数
+
+        Returns:
+            list[np.ndarray]: 与 texts 一一对应的 float32 向量
+        """
+        vectors = self.get_many(model, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            new_vectors = [np.asarray(v, dtype=np.float32) for v in embed_fn(missing)]
+            self.put_many(model, missing, new_vectors)
+            computed = dict(zip(missing, new_vectors))
+            vectors = [v if v is not None else computed[t] for t, v in zip(texts, vectors)]
+        return vectors
+
+    def sample_vectors(self, limit: int = 50_000) -> np.ndarray:
+        """按最近使用取出最多 limit 条向量，用来训练降维/量化或评估召回率；只保留最常见的维度"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT vector FROM embeddings ORDER BY last_used DESC LIMIT ?", (limit,)
+            ).fetchall()
+        vectors = [np.frombuffer(blob, dtype=np.float32) for (blob,) in rows]
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        dims = [len(v) for v in vectors]
+        dim = max(set(dims), key=dims.count)
+        return np.stack([v for v in vectors if len(v) == dim])
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        """返回命中统计，便于打印或上报"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "entries": self._count,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+
+
+def get_cache() -> EmbeddingCache:
+    """进程内共享的默认缓存实例，第一次用到时才创建文件"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+    return _default_cache
+
+
+if __name__ == "__main__":
+    cache = EmbeddingCache("demo_cache.sqlite3", max_entries=2)
+    fake_embed = lambda texts: [np.random.rand(4) for _ in texts]
+    cache.embed("demo", ["你好", "再见"], fake_embed)
+    cache.embed("demo", ["你好", "谢谢"], fake_embed)  # “你好”命中，“谢谢”写入后淘汰最久未用的“再见”
+    print(cache.stats())
+
+"""
+{'hits': 1, 'misses': 3, 'hit_rate': 0.25, 'entries': 2}
+"""
@@ -1,12 +1,19 @@
 # 调用大语言模型生成结果
 
 import os
+import time
 import dotenv
 import dashscope
 import redis
 import numpy as np
 from http import HTTPStatus
 from redis.commands.search.query import Query
+from context_packer import pack_context, CONTEXT_TOKEN_BUDGET
+from Embedding_model import embed_texts, embed_for_index, encode_vector, INDEX_DIM, INDEX_VERSION_KEY
+from answer_cache import SemanticCache
+from local_search import get_local_index
+from quantize import get_pq_index
+from rerank import get_reranker, RERANK_RETRIEVE_K, RERANK_TOP_N
 from openai import OpenAI
 
 # ========== 配置 ==========
@@ -14,8 +21,17 @@ dotenv.load_dotenv()
 dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
 
 INDEX_NAME = "faq_index"
-VECTOR_DIM = 1024
+VECTOR_DIM = INDEX_DIM  # 开启降维后为投影后的维度
 TOP_K = 3
+# 检索后端：redis 走 RediSearch KNN，local 走进程内的 NumPy 向量索引，pq 走乘积量化 + 精排
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "redis")
+# 重排默认关闭，RERANK_ENABLED=1 开启：先召回 RERANK_RETRIEVE_K 条，重排后只把最好的 RERANK_TOP_N 条送进 prompt
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+# 生成答案用的大模型及参数
+LLM_MODEL = "gpt-3.5-turbo"
+SYSTEM_PROMPT = "你是一个有帮助的问答助手。"
+MAX_TOKENS = 512
+TEMPERATURE = 0.2
 
 redis_client = redis.Redis(
     host="localhost",
@@ -35,16 +51,10 @@ def embed_question(question: str):
     返回：
         bytes: 转换后的向量，字节格式。
     """
-    resp = deshscope.MultiModalEmbedding.ccll(
-        model = "multimodal-embedding-v1",
-        input = [{"text": question}]
-    )
-    if resp.status_code == HTTPStatue.OK:
-        embedding = resp.output["embeddings"][0]["embedding"]
-        return np.array(embedding, dtype = np.float32).tobytes()
-        # 先转 NumPy（内存连续），再转字节流（32 bit × 1024 = 4096 字节），Redis 向量字段只接受这种格式。
-    else:
-        raise RuntimeError(f"❌ Embedding 调用失败: {resp.code}, {resp.message}")
+    # 走共享的向量缓存，高频问题不会重复请求模型
+    embedding = embed_for_index([question])[0]
+    return encode_vector(embedding)
+    # 按索引的向量类型（VECTOR_TYPE，默认 FLOAT32：32 bit × 1024 = 4096 字节）转成字节流，Redis 向量字段只接受这种格式。
 
 # 相似度搜索
 def search_faq(question: str, top_k = TOP_K):
@@ -58,6 +68,12 @@ def search_faq(question: str, top_k = TOP_K):
     返回:
         list: 包含匹配文档对象的列表，每个对象包含字段如 question、answer、source 等。
     """
+    if SEARCH_BACKEND == "local":
+        # 本地索引返回的文档同样带 question/answer 等字段，build_prompt 无需区分
+        return get_local_index(redis_client).search(embed_for_index([question])[0], top_k)
+    if SEARCH_BACKEND == "pq":
+        return get_pq_index(redis_client).search(embed_for_index([question])[0], top_k)
+
     q_vector = embed_question(question)
 
     # 构造 Redis 向量搜索查询语句
@@ -73,7 +89,8 @@ def search_faq(question: str, top_k = TOP_K):
     return results.docs
 
 # 构建prompt
-def build_prompt(user_question: str, retrieved_docs, top_k = TOP_K) -> str:
+def build_prompt(user_question: str, retrieved_docs, top_k = TOP_K,
+                 token_budget = CONTEXT_TOKEN_BUDGET, report: dict = None) -> str:
     """
     根据用户问题和检索到的相关文档构建用于大模型推理的 Prompt。
 
@@ -81,15 +98,24 @@ def build_prompt(user_question: str, retrieved_docs, top_k = TOP_K) -> str:
         user_question (str): 用户提出的问题。
         retrieved_docs (list): 检索到的相关文档列表。
         top_k (int): 使用的文档数量上限，默认为 TOP_K。
+        token_budget (int): 文档片段部分的 token 预算，None 表示不限制、原样拼接。
+        report (dict): 可选，传入后写入本次打包节省的 token 数等统计，见 pack_context。
 
     返回:
         str: 构建完成的 Prompt 字符串。
     """
     context_parts = []
-    #  保证只取前 top_k 条，防止上游召回过多,让人类友好的序号从 1 开始，而不是 0
-    for i, doc in enumerate(retrieved_docs[:top_k], start = 1):
+    #  保证只取前 top_k 条，防止上游召回过多
+    candidates = retrieved_docs[:top_k]
+    if token_budget is None:
+        packed = [(doc, doc.answer) for doc in candidates]
+    else:
+        # 在预算内按相关度装入，去掉近似重复的片段，过长的答案在句子边界截断
+        packed = pack_context(candidates, token_budget, report = report)
+    # 让人类友好的序号从 1 开始，而不是 0
+    for i, (doc, answer) in enumerate(packed, start = 1):
         context_parts.append(
-            f"【文档片段{i}】\nQ: {doc.question}\nA: {doc.answer}\n"
+            f"【文档片段{i}】\nQ: {doc.question}\nA: {answer}\n"
         )
 
     # 用双换行把片段隔开，让大模型更容易区分“哪段是哪段”，比单 \n 更直观  
@@ -122,14 +148,15 @@ def ask_llm(prompt: str) -> str:
     返回:
         str: 大语言模型生成的回答文本。
     """
-    resp = dashscope.ChatCompletion.ccll(
-        model = "gpt-3.5-turbo",
+    resp = dashscope.Generation.call(
+        model = LLM_MODEL,
         messages = [
-            {"role": "system", "content": "你是一个有帮助的问答助手。"},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ],
-        max_tokens = 512,
-        temperature = 0.2
+        result_format = "message",
+        max_tokens = MAX_TOKENS,
+        temperature = TEMPERATURE
     )
 
     if resp.status_code == HTTPStatus.OK:
@@ -138,24 +165,111 @@ def ask_llm(prompt: str) -> str:
     else:
         raise RuntimeError(f"❌ LLM 调用失败: {resp.code}, {resp.message}")
 
+# 流式调用大语言模型
+def ask_llm_stream(prompt: str, stats: dict = None):
+    """
+    流式生成回答，模型每吐出一段文本就立刻 yield，用户不必等整段生成完。
+
+    参数:
+        prompt (str): 构建好的 Prompt 字符串。
+        stats (dict): 可选，传入后会被填上本次请求的延迟指标：
+            ttft_ms（首个 token 耗时）、total_ms（总耗时）、
+            output_tokens（输出 token 数）、tokens_per_s（首 token 之后的生成速度）。
+
+    返回:
+        Iterator[str]: 逐段返回的回答文本。
+    """
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+    first_token_at = None
+    chunks = 0
+    output_tokens = None
+
+    responses = dashscope.Generation.call(
+        model = LLM_MODEL,
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        result_format = "message",
+        max_tokens = MAX_TOKENS,
+        temperature = TEMPERATURE,
+        stream = True,
+        incremental_output = True  # 每个分片只带新增内容，而不是累计全文
+    )
+    for resp in responses:
+        if resp.status_code != HTTPStatus.OK:
+            raise RuntimeError(f"❌ LLM 调用失败: {resp.code}, {resp.message}")
+        if resp.usage:
+            output_tokens = resp.usage.get("output_tokens", output_tokens)
+        delta = resp.output["choices"][0]["message"]["content"]
+        if not delta:
+            continue
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        chunks += 1
+        yield delta
+
+    end = time.perf_counter()
+    stats.update(stream_metrics(start, first_token_at, end, output_tokens or chunks))
+
+def stream_metrics(start: float, first_token_at: float, end: float, output_tokens: int) -> dict:
+    """根据时间点计算首 token 延迟、总延迟和生成速度（毫秒 / token 每秒）"""
+    first_token_at = first_token_at or end
+    generation_s = end - first_token_at
+    return {
+        "ttft_ms": round((first_token_at - start) * 1000, 1),
+        "total_ms": round((end - start) * 1000, 1),
+        "output_tokens": output_tokens,
+        "tokens_per_s": round(output_tokens / generation_s, 1) if generation_s > 0 else 0.0,
+    }
+
 if __name__ == "__main__":
+    answer_cache = SemanticCache()
     while True:
         user_question = input("\n请输入问题（输入 exit 退出）：")
         if user_question.lower() in ["exit", "quit"]:
             break
 
-        docs = search_faq(user_question, top_k=TOP_K)
+        # FAQ 数据有变化时清空答案缓存，避免返回过期回答
+        answer_cache.sync_version(redis_client.get(INDEX_VERSION_KEY))
+
+        # 语义相近的问题之前答过，直接返回缓存的回答，不再调用大模型
+        q_vector = embed_texts([user_question])[0]
+        cached = answer_cache.get(q_vector)
+        if cached is not None:
+            print(f"💡 大模型回答（缓存命中，相似问题：{cached['question']}）：")
+            print(cached["answer"])
+            continue
+
+        docs = search_faq(user_question, top_k=RERANK_RETRIEVE_K if RERANK_ENABLED else TOP_K)
         if not docs:
             print("⚠️ 未检索到相关文档")
             continue
+        if RERANK_ENABLED:
+            start = time.perf_counter()
+            retrieved = len(docs)
+            docs = get_reranker().rerank(user_question, docs, top_n=RERANK_TOP_N)
+            print(f"🔀 重排 {retrieved} → {len(docs)} 条，耗时 {(time.perf_counter() - start) * 1000:.1f}ms")
 
-        prompt = build_prompt(user_question, docs)
-        answer = ask_llm(prompt)
+        report = {}
+        prompt = build_prompt(user_question, docs, report=report)
+        print(f"📦 上下文 {report['used_tokens']} tokens，节省 {report['saved_tokens']} tokens")
         print("💡 大模型回答：")
-        print(answer)
+        # 边生成边打印，同时记录首 token 延迟和生成速度
+        stats = {}
+        parts = []
+        for delta in ask_llm_stream(prompt, stats):
+            parts.append(delta)
+            print(delta, end="", flush=True)
+        print(f"\n⏱️ 首 token {stats['ttft_ms']}ms，总耗时 {stats['total_ms']}ms，{stats['tokens_per_s']} tokens/s")
+        answer = "".join(parts).strip()
+        answer_cache.put(q_vector, user_question, answer, [doc.id for doc in docs])
 
 """
 请输入问题（输入 exit 退出）：为什么会出现无法下单的情况
+📦 上下文 232 tokens，节省 0 tokens
 💡 大模型回答：
 无法下单的情况可能是由于菜品售完、餐厅不在营业时间等原因。请查看下单时的提示信息以获取具体原因。
+⏱️ 首 token 412.3ms，总耗时 1268.9ms，38.5 tokens/s
 """
\ No newline at end of file
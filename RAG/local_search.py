@@ -0,0 +1,269 @@
+# 进程内向量检索：把 FAQ 向量载入一块连续的 float32 矩阵，用矩阵乘法代替 RediSearch KNN
+import os
+import json
+import time
+import threading
+import numpy as np
+from types import SimpleNamespace
+from Embedding_model import decode_vector, INDEX_DIM, INDEX_VERSION_KEY, VECTOR_TYPE, PROJECTION_METHOD
+
+FAQ_PREFIX = "faq:"   # 与 Redis 索引前缀保持一致
+RETURN_FIELDS = ("question", "answer", "source", "category", "crawl_time")
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "faq_local_index")  # 落盘文件前缀
+IVF_NPROBE = 8   # IVF 模式下每次查询扫描的聚类个数
+IVF_MIN_SIZE = 10_000  # 数据量达到多少条时重建索引顺便构建 IVF
+INDEX_CHECK_INTERVAL = 5.0  # 每隔多少秒检查一次 Redis 中的数据版本，判断本地索引是否过期
+
+
+def index_signature(redis_client) -> dict:
+    """
+    本地索引对应的数据指纹：FAQ 数据版本号、索引维度、向量类型和降维方式。
+    任何一项和 Redis / 当前配置不一致，本地索引就是过期的，需要重新拉取。
+    """
+    version = redis_client.get(INDEX_VERSION_KEY)
+    return {
+        "version": version.decode() if version is not None else None,
+        "dim": INDEX_DIM,
+        "vector_type": VECTOR_TYPE,
+        "projection": PROJECTION_METHOD,
+    }
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    """按行做 L2 归一化，之后点积就等于余弦相似度"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class LocalVectorIndex:
+    """
+    内存（或 mmap）向量索引
+
+    向量归一化后按行存成 C 连续的 float32 矩阵，精确检索就是一次矩阵-向量乘法
+    加 argpartition 取 top-k；数据量大时可以 build_ivf() 先聚类，查询只扫描最近的几个簇。
+    返回的文档和 Redis 查询结果形状一致（有 id、score 以及各个文本字段），
+    score 同样是余弦距离（越小越相似），build_prompt 不需要任何改动。
+
+    Args:
+        vectors (np.ndarray): 形状为 (N, dim) 的向量矩阵
+        docs (list[dict]): 与向量一一对应的 FAQ 字段
+        keys (list[str]): 与向量一一对应的 Redis key
+        normalized (bool): vectors 是否已经归一化（从磁盘加载时为 True）
+        signature (dict): 构建时的数据指纹（见 index_signature），用来判断是否过期
+    """
+
+    def __init__(self, vectors: np.ndarray, docs: list, keys: list, normalized: bool = False,
+                 signature: dict = None):
+        if not normalized:
+            vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        # mmap 加载的数组本身就是连续的，这里不会产生拷贝
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.docs = docs
+        self.keys = keys
+        self.signature = signature
+        self.centroids = None
+        self.assignments = None
+        self._lists = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_redis(cls, redis_client, prefix: str = FAQ_PREFIX, batch_size: int = 500):
+        """
+        用 SCAN + pipeline 把 Redis 中的 FAQ 向量和字段一次性拉到本地；
+        没有 embedding 字段的 key（写了一半，或者 SCAN 之后被删掉）直接跳过
+        """
+        # 先记下指纹再拉数据：拉取过程中数据又变了，下次检查时版本号对不上会再重建
+        signature = index_signature(redis_client)
+        scanned = sorted(key.decode() for key in redis_client.scan_iter(match=prefix + "*", count=1000))
+        keys, vectors, docs = [], [], []
+        for begin in range(0, len(scanned), batch_size):
+            part = scanned[begin:begin + batch_size]
+            pipe = redis_client.pipeline(transaction=False)
+            for key in part:
+                pipe.hmget(key, "embedding", *RETURN_FIELDS)
+            for key, values in zip(part, pipe.execute()):
+                if values[0] is None:
+                    continue
+                keys.append(key)
+                vectors.append(decode_vector(values[0]))
+                docs.append({
+                    field: (value.decode() if value is not None else "")
+                    for field, value in zip(RETURN_FIELDS, values[1:])
+                })
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, INDEX_DIM), dtype=np.float32)
+        return cls(matrix, docs, keys, signature=signature)
+
+    def save(self, path: str = LOCAL_INDEX_PATH):
+        """向量存成 .npy（可 mmap），字段、key 和数据指纹存成 .json，IVF 聚类结果存成 .ivf.npz"""
+        np.save(path + ".npy", self.vectors)
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"keys": self.keys, "docs": self.docs, "signature": self.signature}, f, ensure_ascii=False)
+        if self.centroids is not None:
+            np.savez(path + ".ivf.npz", centroids=self.centroids, assignments=self.assignments)
+        elif os.path.exists(path + ".ivf.npz"):
+            os.remove(path + ".ivf.npz")  # 旧的聚类结果和新数据的行号对不上
+
+    @classmethod
+    def load(cls, path: str = LOCAL_INDEX_PATH, mmap: bool = True):
+        """从磁盘加载；mmap=True 时向量矩阵按需分页读入，不占用常驻内存"""
+        vectors = np.load(path + ".npy", mmap_mode="r" if mmap else None)
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        # 旧版本保存的文件没有指纹，视为过期
+        index = cls(vectors, meta["docs"], meta["keys"], normalized=True, signature=meta.get("signature"))
+        if os.path.exists(path + ".ivf.npz"):
+            ivf = np.load(path + ".ivf.npz")
+            index._set_ivf(ivf["centroids"], ivf["assignments"])
+        return index
+
+    def build_ivf(self, n_lists: int = None, n_iter: int = 10, seed: int = 0):
+        """
+        球面 k-means 聚类，构建倒排（IVF）结构
+
+        Args:
+            n_lists (int): 聚类个数，默认取 sqrt(N)
+            n_iter (int): k-means 迭代次数
+            seed (int): 随机种子，保证结果可复现
+        """
+        n = len(self)
+        n_lists = n_lists or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        centroids = self.vectors[rng.choice(n, n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+            # 用 bincount 风格的 add.at 一次性累加各簇向量，避免 Python 循环
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, self.vectors)
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]  # 空簇保持原中心
+            centroids = _normalize(sums)
+        assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+        self._set_ivf(centroids.astype(np.float32), assignments.astype(np.int32))
+
+    def _set_ivf(self, centroids: np.ndarray, assignments: np.ndarray):
+        self.centroids = centroids
+        self.assignments = assignments
+        # 按簇号排序后切片，得到每个簇的行号列表
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(centroids))]
+
+    def _top_k(self, scores: np.ndarray, top_k: int) -> np.ndarray:
+        """argpartition 取出前 k 个（O(N)），再只对这 k 个排序"""
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        part = np.argpartition(-scores, top_k - 1)[:top_k]
+        return part[np.argsort(-scores[part], kind="stable")]
+
+    def _to_doc(self, row: int, similarity: float):
+        """组装成和 Redis 查询结果同样形状的文档对象"""
+        return SimpleNamespace(id=self.keys[row], score=1.0 - float(similarity), **self.docs[row])
+
+    def search(self, query_vector: np.ndarray, top_k: int = 3, nprobe: int = None) -> list:
+        """
+        检索与查询向量最相似的 top_k 条 FAQ
+
+        Args:
+            query_vector (np.ndarray): 查询向量
+            top_k (int): 返回条数
+            nprobe (int): 构建过 IVF 时扫描的簇数，None 表示用 IVF_NPROBE；传 0 强制精确检索
+
+        Returns:
+            list: 文档对象列表，按 score（余弦距离）从小到大排列
+        """
+        query = _normalize(np.asarray(query_vector, dtype=np.float32).reshape(-1))
+        if nprobe is None:
+            nprobe = IVF_NPROBE
+        if self.centroids is not None and nprobe > 0:
+            probe = self._top_k(self.centroids @ query, nprobe)
+            rows = np.concatenate([self._lists[c] for c in probe])
+            scores = self.vectors[rows] @ query
+            best = self._top_k(scores, top_k)
+            return [self._to_doc(int(rows[i]), scores[i]) for i in best]
+
+        scores = self.vectors @ query
+        best = self._top_k(scores, top_k)
+        return [self._to_doc(int(i), scores[i]) for i in best]
+
+    def search_batch(self, query_vectors: np.ndarray, top_k: int = 3) -> list:
+        """
+        批量精确检索：所有查询的得分用一次矩阵乘法 (Q, dim) @ (dim, N) 算出，
+        再按行 argpartition 取 top-k
+
+        Args:
+            query_vectors (np.ndarray): 形状为 (Q, dim) 的查询矩阵
+            top_k (int): 每个查询返回的条数
+
+        Returns:
+            list[list]: 每个查询对应一个文档列表，顺序与 query_vectors 一致
+        """
+        queries = _normalize(np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1))
+        scores = queries @ self.vectors.T
+        top_k = min(top_k, scores.shape[1])
+        if top_k <= 0:
+            return [[] for _ in range(len(queries))]
+        part = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        best = np.take_along_axis(part, order, axis=1)
+        return [
+            [self._to_doc(int(i), scores[q, i]) for i in row]
+            for q, row in enumerate(best)
+        ]
+
+
+_local_index = None
+_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def build_local_index(redis_client, path: str = LOCAL_INDEX_PATH) -> LocalVectorIndex:
+    """从 Redis 拉取全部向量重建本地索引，数据量大时构建 IVF，然后落盘"""
+    index = LocalVectorIndex.from_redis(redis_client)
+    if len(index) >= IVF_MIN_SIZE:
+        index.build_ivf()
+    index.save(path)
+    return index
+
+
+def get_local_index(redis_client=None, path: str = LOCAL_INDEX_PATH) -> LocalVectorIndex:
+    """
+    进程内共享的本地索引：磁盘上的索引与 Redis 的数据指纹一致就 mmap 加载，否则从 Redis 重建后落盘。
+    之后每隔 INDEX_CHECK_INTERVAL 秒比对一次指纹，增量同步、批量导入（版本号变化）
+    或者修改 VECTOR_TYPE / PROJECTED_DIM 之后会自动重建，不会继续返回已删除或过期的 FAQ。
+    不传 redis_client 时无法比对，只加载磁盘上已有的索引。
+    """
+    global _local_index, _checked_at
+    with _index_lock:
+        if redis_client is None:
+            if _local_index is None:
+                _local_index = LocalVectorIndex.load(path)
+            return _local_index
+        now = time.monotonic()
+        if _local_index is not None and now - _checked_at < INDEX_CHECK_INTERVAL:
+            return _local_index
+        _checked_at = now
+        signature = index_signature(redis_client)
+        if _local_index is not None and _local_index.signature == signature:
+            return _local_index
+        if os.path.exists(path + ".npy"):
+            on_disk = LocalVectorIndex.load(path)
+            if on_disk.signature == signature:
+                _local_index = on_disk
+                return _local_index
+        print(f"🔁 本地索引不存在或已过期，从 Redis 重建: {signature}")
+        _local_index = build_local_index(redis_client, path)
+        return _local_index
+
+
+if __name__ == "__main__":
+    import redis
+
+    # 从 Redis 导出本地索引；数据量上万时顺便构建 IVF
+    client = redis.Redis(host="localhost", port=6379, decode_responses=False)
+    index = build_local_index(client)
+    print(f"✅ 已导出 {len(index)} 条向量到 {LOCAL_INDEX_PATH}.npy")
@@ -0,0 +1,129 @@
+# 降维：入库前把模型输出的向量投影到更低维度（PCA 或前缀截断），查询时套用同一个投影
+import io
+import os
+import numpy as np
+
+PROJECTION_METHOD = os.getenv("PROJECTION_METHOD", "none")  # none / pca / truncate
+PROJECTED_DIM = int(os.getenv("PROJECTED_DIM", "256"))      # 降维后的维度
+PCA_SAMPLE = 20_000                                         # 训练 PCA 最多使用的样本数
+
+
+class Projection:
+    """
+    向量投影
+
+    pca：减去均值后乘以前 dim 个主成分，适合任意向量模型；
+    truncate：直接取前 dim 维（Matryoshka 式截断），只适合按该方式训练过的模型。
+    两种方式投影后都会重新做 L2 归一化，保证余弦距离的含义不变。
+
+    Args:
+        method (str): "pca" 或 "truncate"
+        dim (int): 输出维度
+        mean (np.ndarray): PCA 的均值向量
+        components (np.ndarray): PCA 的投影矩阵，形状 (输入维度, dim)
+    """
+
+    def __init__(self, method: str, dim: int, mean: np.ndarray = None, components: np.ndarray = None):
+        self.method = method
+        self.dim = dim
+        self.mean = mean
+        self.components = components
+
+    @classmethod
+    def fit_pca(cls, vectors: np.ndarray, dim: int = PROJECTED_DIM, sample: int = PCA_SAMPLE, seed: int = 0):
+        """对（抽样后的）向量做 SVD，取前 dim 个主成分"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) < dim:
+            raise ValueError(f"PCA 至少需要 {dim} 条样本，当前只有 {len(vectors)} 条")
+        if len(vectors) > sample:
+            vectors = vectors[np.random.default_rng(seed).choice(len(vectors), sample, replace=False)]
+        mean = vectors.mean(axis=0)
+        # 经济型 SVD：vt 的前 dim 行就是方差最大的方向
+        _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        return cls("pca", dim, mean.astype(np.float32), np.ascontiguousarray(vt[:dim].T, dtype=np.float32))
+
+    @classmethod
+    def truncate(cls, dim: int = PROJECTED_DIM):
+        return cls("truncate", dim)
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        """投影并归一化，支持单条 (dim,) 或批量 (N, dim) 输入"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.method == "pca":
+            projected = (vectors - self.mean) @ self.components
+        else:
+            projected = vectors[..., :self.dim]
+        norms = np.linalg.norm(projected, axis=-1, keepdims=True)
+        return projected / np.where(norms == 0, 1.0, norms)
+
+    def to_bytes(self) -> bytes:
+        """序列化成 npz 字节串，便于和索引一起存进 Redis"""
+        buf = io.BytesIO()
+        arrays = {"method": np.array(self.method), "dim": np.array(self.dim)}
+        if self.method == "pca":
+            arrays.update(mean=self.mean, components=self.components)
+        np.savez(buf, **arrays)
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, blob: bytes):
+        data = np.load(io.BytesIO(blob))
+        method = str(data["method"])
+        if method == "pca":
+            return cls(method, int(data["dim"]), data["mean"], data["components"])
+        return cls(method, int(data["dim"]))
+
+
+def _recall(truth: np.ndarray, approx: np.ndarray) -> float:
+    return float(np.mean([len(set(t) & set(a)) / len(t) for t, a in zip(truth, approx)]))
+
+
+def recall_loss_report(vectors: np.ndarray, dims=(512, 256, 128, 64), n_queries: int = 200,
+                       top_k: int = 10, seed: int = 0):
+    """
+    比较不同降维方式和维度下的 recall@top_k（以原始维度精确检索为基准），
+    以及单条向量字节数和检索耗时的变化
+
+    Args:
+        vectors (np.ndarray): (N, dim) 的原始向量
+        dims (tuple): 要评估的目标维度
+        n_queries (int): 抽取多少条向量（加少量噪声）当查询
+        top_k (int): 召回率计算的 k
+    """
+    import time
+    from quantize import _print_table
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    n, full_dim = vectors.shape
+    queries = vectors[rng.choice(n, n_queries)] + rng.normal(0, 0.01, (n_queries, full_dim)).astype(np.float32)
+
+    def search(matrix, q):
+        start = time.perf_counter()
+        ids = np.argsort(-(q @ matrix.T), axis=1)[:, :top_k]
+        return ids, (time.perf_counter() - start) / len(q) * 1000
+
+    truth, full_ms = search(vectors, queries / np.linalg.norm(queries, axis=1, keepdims=True))
+    rows = [("full", str(full_dim), str(full_dim * 4), f"{1.0:.3f}", f"{full_ms:.3f}ms")]
+    for method in ("pca", "truncate"):
+        for dim in dims:
+            if dim >= full_dim:
+                continue
+            proj = Projection.fit_pca(vectors, dim) if method == "pca" else Projection.truncate(dim)
+            approx, ms = search(proj.apply(vectors), proj.apply(queries))
+            rows.append((method, str(dim), str(dim * 4), f"{_recall(truth, approx):.3f}", f"{ms:.3f}ms"))
+    _print_table(f"📊 {n} 条 {full_dim} 维向量，{n_queries} 次查询，recall@{top_k}（基准为原始维度精确检索）",
+                 ("方式", "维度", "字节/条", "召回率", "单次检索"), rows, (12, 8, 10, 10, 12))
+
+
+if __name__ == "__main__":
+    from embedding_cache import get_cache
+
+    # 向量缓存里存着入库时模型输出的原始向量，正好拿来评估降维损失
+    data = get_cache().sample_vectors(limit=50_000)
+    if len(data) < 100:
+        print("⚠️ 向量缓存中样本太少，使用带聚类结构的随机向量演示")
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((100, 1024)).astype(np.float32)
+        data = centers[rng.integers(0, 100, 10_000)] + 0.5 * rng.standard_normal((10_000, 1024)).astype(np.float32)
+    recall_loss_report(data)
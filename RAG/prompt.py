@@ -6,6 +6,8 @@ import redis
 import numpy as np
 from http import HTTPStatus
 from redis.commands.search.query import Query
+from context_packer import pack_context, CONTEXT_TOKEN_BUDGET
+from Embedding_model import embed_for_index, encode_vector, INDEX_DIM
 
 # ========== 配置 ==========
 # 加载环境变量
@@ -15,8 +17,8 @@ dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
 
 # Redis 向量索引名称
 INDEX_NAME = "faq_index"
-# 向量维度
-VECTOR_DIM = 1024
+# 索引中的向量维度（开启降维后为投影后的维度）
+VECTOR_DIM = INDEX_DIM
 # 相似度搜索返回的最相似结果数量
 TOP_K = 3
 
@@ -39,16 +41,10 @@ def embed_question(question: str):
     返回：
         bytes: 转换后的向量，字节格式。
     """
-    resp = deshscope.MultiModalEmbedding.ccll(
-        model = "multimodal-embedding-v1",
-        input = [{"text": question}]
-    )
-    if resp.status_code == HTTPStatue.OK:
-        embedding = resp.output["embeddings"][0]["embedding"]
-        return np.array(embedding, dtype = np.float32).tobytes()
-        # 先转 NumPy（内存连续），再转字节流（32 bit × 1024 = 4096 字节），Redis 向量字段只接受这种格式。
-    else:
-        raise RuntimeError(f"❌ Embedding 调用失败: {resp.code}, {resp.message}")
+    # 走共享的向量缓存，高频问题不会重复请求模型
+    embedding = embed_for_index([question])[0]
+    return encode_vector(embedding)
+    # 按索引的向量类型（VECTOR_TYPE，默认 FLOAT32：32 bit × 1024 = 4096 字节）转成字节流，Redis 向量字段只接受这种格式。
 
 # 相似度搜索
 def search_faq(question: str, top_k = TOP_K):
@@ -77,7 +73,8 @@ def search_faq(question: str, top_k = TOP_K):
     return results.docs
 
 # 构建prompt
-def build_prompt(user_question: str, retrieved_docs, top_k = TOP_K) -> str:
+def build_prompt(user_question: str, retrieved_docs, top_k = TOP_K,
+                 token_budget = CONTEXT_TOKEN_BUDGET, report: dict = None) -> str:
     """
     根据用户问题和检索到的相关文档构建用于大模型推理的 Prompt。
 
@@ -85,15 +82,24 @@ def build_prompt(user_question: str, retrieved_docs, top_k = TOP_K) -> str:
         user_question (str): 用户提出的问题。
         retrieved_docs (list): 检索到的相关文档列表。
         top_k (int): 使用的文档数量上限，默认为 TOP_K。
+        token_budget (int): 文档片段部分的 token 预算，None 表示不限制、原样拼接。
+        report (dict): 可选，传入后写入本次打包节省的 token 数等统计，见 pack_context。
 
     返回:
         str: 构建完成的 Prompt 字符串。
     """
     context_parts = []
-    #  保证只取前 top_k 条，防止上游召回过多,让人类友好的序号从 1 开始，而不是 0
-    for i, doc in enumerate(retrieved_docs[:top_k], start = 1):
+    #  保证只取前 top_k 条，防止上游召回过多
+    candidates = retrieved_docs[:top_k]
+    if token_budget is None:
+        packed = [(doc, doc.answer) for doc in candidates]
+    else:
+        # 在预算内按相关度装入，去掉近似重复的片段，过长的答案在句子边界截断
+        packed = pack_context(candidates, token_budget, report = report)
+    # 让人类友好的序号从 1 开始，而不是 0
+    for i, (doc, answer) in enumerate(packed, start = 1):
         context_parts.append(
-            f"【文档片段{i}】\nQ: {doc.question}\nA: {doc.answer}\n"
+            f"【文档片段{i}】\nQ: {doc.question}\nA: {answer}\n"
         )
 
     # 用双换行把片段隔开，让大模型更容易区分“哪段是哪段”，比单 \n 更直观  
@@ -122,15 +128,18 @@ if __name__ == "__main__":
         if user_question.lower() in ["exit", "quit"]:
             break
 
-        docs = (user_question, top_k = TOP_K)
+        docs = search_faq(user_question, top_k = TOP_K)
         if not docs:
             print("⚠️ 未检索到相关文档")
             continue           
 
-        prompt = build_prompt(user_question, docs)
+        report = {}
+        prompt = build_prompt(user_question, docs, report = report)
         print("\n===== 构建的 Prompt =====\n")
         print(prompt)
         print("\n=========================\n")
+        print(f"📦 上下文 {report['used_tokens']} tokens，节省 {report['saved_tokens']} tokens"
+              f"（去重 {report['deduped']}，截断 {report['truncated']}，丢弃 {report['dropped']}）")
 
 # 执行结果如下：
 """
@@ -162,6 +171,7 @@ A: 同一手机号在同一设备上一天最多可以成功提交7次订单（
 
 =========================
 
+📦 上下文 232 tokens，节省 0 tokens（去重 0，截断 0，丢弃 0）
 
 请输入问题（输入 exit 退出）：exit
 """
\ No newline at end of file
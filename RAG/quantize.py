@@ -0,0 +1,305 @@
+# 向量量化：float16 / int8 标量量化减少 Redis 中每条 FAQ 向量的内存；乘积量化（PQ）用于进程内检索
+import os
+import json
+import threading
+import unicodedata
+import numpy as np
+
+VECTOR_TYPES = ("FLOAT32", "FLOAT16", "INT8")  # 写进 Redis 向量字段的类型
+PQ_SUBSPACES = 64       # PQ 把向量切成多少段，每段编码成 1 字节
+PQ_CENTROIDS = 256      # 每段的码本大小，256 正好一个 uint8
+RERANK_CANDIDATES = 50  # PQ 粗排后用原始 float32 向量精排的候选数
+PQ_PATH = os.getenv("PQ_INDEX_PATH", "faq_pq")  # PQ 码本和编码的落盘前缀
+
+
+def encode(vector: np.ndarray, vector_type: str = "FLOAT32") -> bytes:
+    """
+    按向量字段类型把 float32 向量转成 Redis 可存的字节串
+
+    INT8 采用逐向量对称缩放：先除以最大绝对值再乘 127，
+    余弦距离与整体缩放无关，所以不需要额外保存缩放系数。
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    if vector_type == "FLOAT32":
+        return vector.tobytes()
+    if vector_type == "FLOAT16":
+        return vector.astype(np.float16).tobytes()
+    if vector_type == "INT8":
+        max_abs = float(np.abs(vector).max()) or 1.0
+        return np.round(vector / max_abs * 127).astype(np.int8).tobytes()
+    raise ValueError(f"不支持的向量类型: {vector_type}，可选 {VECTOR_TYPES}")
+
+
+def decode(blob: bytes, vector_type: str = "FLOAT32") -> np.ndarray:
+    """encode 的逆过程，统一还原成 float32（INT8 只能还原方向，模长不保证）"""
+    dtype = {"FLOAT32": np.float32, "FLOAT16": np.float16, "INT8": np.int8}[vector_type]
+    return np.frombuffer(blob, dtype=dtype).astype(np.float32)
+
+
+def bytes_per_vector(dim: int, vector_type: str) -> int:
+    return dim * {"FLOAT32": 4, "FLOAT16": 2, "INT8": 1}[vector_type]
+
+
+def _kmeans(data: np.ndarray, k: int, n_iter: int, rng) -> np.ndarray:
+    """欧氏距离 k-means，返回 (k, dim) 的聚类中心"""
+    centroids = data[rng.choice(len(data), k, replace=len(data) < k)].copy()
+    for _ in range(n_iter):
+        # ||x - c||² = ||x||² - 2x·c + ||c||²，前一项对 argmin 无影响
+        dist = -2 * data @ centroids.T + (centroids ** 2).sum(axis=1)
+        labels = np.argmin(dist, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class ProductQuantizer:
+    """
+    乘积量化
+
+    把 dim 维向量切成 m 段，每段用 k-means 训练 256 个中心，
+    每条向量只存 m 个字节的中心编号（1024 维 float32 的 4096 字节 → 64 字节）。
+    查询时先算出查询向量每段与 256 个中心的内积表，
+    候选得分就是 m 次查表相加（ADC），再对前几十个候选用原始向量精排。
+
+    Args:
+        m (int): 子空间个数，需要整除向量维度
+        ksub (int): 每个子空间的中心数，最多 256
+    """
+
+    def __init__(self, m: int = PQ_SUBSPACES, ksub: int = PQ_CENTROIDS):
+        self.m = m
+        self.ksub = ksub
+        self.codebooks = None  # (m, ksub, dsub)
+
+    def fit(self, vectors: np.ndarray, n_iter: int = 15, sample: int = 50_000, seed: int = 0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n, dim = vectors.shape
+        if dim % self.m:
+            raise ValueError(f"向量维度 {dim} 不能被子空间个数 {self.m} 整除")
+        rng = np.random.default_rng(seed)
+        train = vectors[rng.choice(n, min(n, sample), replace=False)]
+        dsub = dim // self.m
+        self.codebooks = np.stack([
+            _kmeans(train[:, i * dsub:(i + 1) * dsub], self.ksub, n_iter, rng)
+            for i in range(self.m)
+        ]).astype(np.float32)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """返回 (N, m) 的 uint8 编码"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dsub = self.codebooks.shape[2]
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for i, book in enumerate(self.codebooks):
+            part = vectors[:, i * dsub:(i + 1) * dsub]
+            dist = -2 * part @ book.T + (book ** 2).sum(axis=1)
+            codes[:, i] = np.argmin(dist, axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.concatenate([self.codebooks[i][codes[:, i]] for i in range(self.m)], axis=1)
+
+    def inner_product_table(self, query: np.ndarray) -> np.ndarray:
+        """查询向量每段与各中心的内积，形状 (m, ksub)"""
+        parts = np.asarray(query, dtype=np.float32).reshape(self.m, -1)
+        return np.einsum("md,mkd->mk", parts, self.codebooks)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """ADC：每条编码的近似内积 = m 次查表之和"""
+        table = self.inner_product_table(query)
+        return table[np.arange(self.m), codes].sum(axis=1)
+
+    def save(self, path: str):
+        np.save(path, self.codebooks)
+
+    @classmethod
+    def load(cls, path: str):
+        codebooks = np.load(path)
+        pq = cls(m=codebooks.shape[0], ksub=codebooks.shape[1])
+        pq.codebooks = codebooks
+        return pq
+
+
+class PQIndex:
+    """
+    PQ 检索：进程内存里只放 (N, m) 的 uint8 编码，
+    原始 float32 向量留在 mmap 的 .npy 里，只在精排时按行读取少量候选。
+    编码只保存在本地文件中，Redis 里仍是完整的 embedding 字段，
+    所以 PQ 节省的是检索进程的内存，不减少 Redis 内存（那要靠 VECTOR_TYPE）。
+
+    Args:
+        index: local_search.LocalVectorIndex，提供精排用的向量和文档字段
+        pq (ProductQuantizer): 已训练的量化器
+        codes (np.ndarray): index 中每条向量的编码
+    """
+
+    def __init__(self, index, pq: ProductQuantizer, codes: np.ndarray):
+        self.index = index
+        self.pq = pq
+        self.codes = codes
+
+    @classmethod
+    def build(cls, index, m: int = PQ_SUBSPACES):
+        pq = ProductQuantizer(m=m).fit(index.vectors)
+        return cls(index, pq, pq.encode(index.vectors))
+
+    def save(self, path: str = PQ_PATH):
+        """码本、编码和对应本地索引的数据指纹分别落盘"""
+        self.pq.save(path + ".codebooks.npy")
+        np.save(path + ".codes.npy", self.codes)
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"signature": self.index.signature, "rows": len(self.codes)}, f)
+
+    @classmethod
+    def load(cls, index, path: str = PQ_PATH):
+        return cls(index, ProductQuantizer.load(path + ".codebooks.npy"), np.load(path + ".codes.npy"))
+
+    @classmethod
+    def load_or_build(cls, index, path: str = PQ_PATH):
+        """
+        得到与 index 逐行对齐的 PQ 索引：
+        磁盘上的编码和 index 的数据指纹一致就直接加载；
+        只是数据版本变了（增删改 FAQ），沿用已有码本重新编码；
+        维度、向量类型或降维方式变了，或者还没有码本，重新训练。
+        """
+        meta = None
+        if os.path.exists(path + ".json") and os.path.exists(path + ".codes.npy"):
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        saved = (meta or {}).get("signature") or {}
+        if meta and saved == index.signature and meta["rows"] == len(index):
+            return cls.load(index, path)
+
+        def layout(signature: dict) -> dict:
+            return {k: v for k, v in signature.items() if k != "version"}
+
+        if saved and index.signature and layout(saved) == layout(index.signature):
+            pq = ProductQuantizer.load(path + ".codebooks.npy")
+            pq_index = cls(index, pq, pq.encode(index.vectors))
+        else:
+            pq_index = cls.build(index)
+        pq_index.save(path)
+        return pq_index
+
+    def search(self, query_vector: np.ndarray, top_k: int = 3, rerank: int = RERANK_CANDIDATES) -> list:
+        """ADC 粗排取 rerank 个候选，再用原始向量精确打分；rerank=0 表示只用 PQ 分数"""
+        query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        query = query / (np.linalg.norm(query) or 1.0)
+        approx = self.pq.scores(query, self.codes)
+        if rerank <= 0:
+            best = self.index._top_k(approx, top_k)
+            return [self.index._to_doc(int(i), approx[i]) for i in best]
+        candidates = self.index._top_k(approx, max(rerank, top_k))
+        # 按行号排序后再读 mmap，顺序访问磁盘页
+        rows = np.sort(candidates)
+        exact = self.index.vectors[rows] @ query
+        best = self.index._top_k(exact, top_k)
+        return [self.index._to_doc(int(rows[i]), exact[i]) for i in best]
+
+
+_pq_index = None
+_pq_lock = threading.Lock()
+
+
+def get_pq_index(redis_client=None, path: str = PQ_PATH) -> PQIndex:
+    """
+    进程内共享的 PQ 索引，始终建立在 get_local_index 当前返回的本地索引之上：
+    本地索引因数据变化重建后，这里随之重新编码（必要时重新训练），编码与行号保持对齐
+    """
+    global _pq_index
+    from local_search import get_local_index
+    index = get_local_index(redis_client)
+    with _pq_lock:
+        if _pq_index is None or _pq_index.index is not index:
+            _pq_index = PQIndex.load_or_build(index, path)
+        return _pq_index
+
+
+def _recall(truth: np.ndarray, approx: np.ndarray) -> float:
+    return float(np.mean([len(set(t) & set(a)) / len(t) for t, a in zip(truth, approx)]))
+
+
+def _display_width(text: str) -> int:
+    """终端显示宽度：中文等全角字符占两列"""
+    return sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
+
+
+def _ljust(text: str, width: int) -> str:
+    return text + " " * max(0, width - _display_width(text))
+
+
+def _rjust(text: str, width: int) -> str:
+    return " " * max(0, width - _display_width(text)) + text
+
+
+def _print_table(title: str, header: tuple, rows: list, widths: tuple):
+    """第一列左对齐，其余列右对齐，按显示宽度补空格，中英文混排也能对齐"""
+    print(title)
+    for row in [header] + rows:
+        cells = [_ljust(row[0], widths[0])] + [_rjust(cell, w) for cell, w in zip(row[1:], widths[1:])]
+        print("".join(cells))
+    print()
+
+
+def recall_memory_report(vectors: np.ndarray, n_queries: int = 200, top_k: int = 10, seed: int = 0):
+    """
+    对比各种存储方式的单条向量字节数和 recall@top_k（以 float32 精确检索为基准），打印成两张表：
+    Redis 向量字段（VECTOR_TYPE，决定 Redis 内存）和进程内 PQ 检索（只决定检索进程内存，Redis 不变）
+
+    Args:
+        vectors (np.ndarray): (N, dim) 的原始向量
+        n_queries (int): 随机抽取多少条向量（加少量噪声）当查询
+        top_k (int): 召回率计算的 k
+    """
+    from local_search import LocalVectorIndex
+    rng = np.random.default_rng(seed)
+    n, dim = vectors.shape
+    index = LocalVectorIndex(vectors, [{} for _ in range(n)], [str(i) for i in range(n)])
+    queries = index.vectors[rng.choice(n, n_queries)] + rng.normal(0, 0.01, (n_queries, dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    def top_ids(matrix):
+        return np.argsort(-(queries @ matrix.T), axis=1)[:, :top_k]
+
+    def row(label: str, size: int, rec: float) -> tuple:
+        return (label, str(size), f"{dim * 4 / size:.1f}x", f"{rec:.3f}")
+
+    truth = top_ids(index.vectors)
+    redis_rows = [row("FLOAT32", bytes_per_vector(dim, "FLOAT32"), 1.0)]
+    for vector_type in ("FLOAT16", "INT8"):
+        restored = np.stack([decode(encode(v, vector_type), vector_type) for v in index.vectors])
+        restored /= np.linalg.norm(restored, axis=1, keepdims=True)
+        redis_rows.append(row(vector_type, bytes_per_vector(dim, vector_type), _recall(truth, top_ids(restored))))
+
+    pq_rows = []
+    for m in (32, 64, 128):
+        if dim % m:
+            continue
+        pq_index = PQIndex.build(index, m=m)
+        for rerank in (0, RERANK_CANDIDATES):
+            approx = [[int(d.id) for d in pq_index.search(q, top_k, rerank=rerank)] for q in queries]
+            label = f"PQ m={m}" + (f" +rerank{rerank}" if rerank else "")
+            pq_rows.append(row(label, m, _recall(truth, approx)))
+
+    print(f"📊 {n} 条 {dim} 维向量，{n_queries} 次查询，recall@{top_k}（基准为 float32 精确检索）\n")
+    widths = (24, 10, 10, 10)
+    _print_table("Redis 向量字段（VECTOR_TYPE，决定 Redis 中每条 FAQ 的向量内存）：",
+                 ("存储方式", "字节/条", "压缩比", "召回率"), redis_rows, widths)
+    _print_table("进程内 PQ 检索（SEARCH_BACKEND=pq，只减少检索进程内存，Redis 仍存完整向量）：",
+                 ("存储方式", "字节/条", "压缩比", "召回率"), pq_rows, widths)
+
+
+if __name__ == "__main__":
+    from local_search import LOCAL_INDEX_PATH
+
+    # 有导出的本地索引就用真实向量，否则用带聚类结构的随机向量演示
+    if os.path.exists(LOCAL_INDEX_PATH + ".npy"):
+        data = np.load(LOCAL_INDEX_PATH + ".npy")
+    else:
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((100, 1024)).astype(np.float32)
+        data = centers[rng.integers(0, 100, 20_000)] + 0.5 * rng.standard_normal((20_000, 1024)).astype(np.float32)
+    recall_memory_report(data)
@@ -0,0 +1,220 @@
+# 重排序：对向量召回的候选按 (问题, 候选) 逐对打分重新排序，只把最相关的几条送进 prompt
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # 没装 sentence-transformers 时退化为词面打分
+    CrossEncoder = None
+
+RERANK_MODEL = os.getenv("RERANK_MODEL", "BAAI/bge-reranker-base")  # 本地交叉编码器模型
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "auto")  # auto：有模型用模型，否则词面；cross / lexical 强制指定
+RERANK_RETRIEVE_K = 50       # 向量召回的候选数
+RERANK_TOP_N = 2             # 重排后送进 prompt 的条数
+RERANK_BATCH_SIZE = 16       # 每批送进模型的 (问题, 候选) 对数，CPU 上 16 左右比较均衡
+RERANK_MAX_LENGTH = 256      # 每对文本截断的 token 数，越短 CPU 越快
+RERANK_TIME_BUDGET_MS = float(os.getenv("RERANK_TIME_BUDGET_MS", "300"))  # 单次重排的时间上限
+RERANK_CACHE_SIZE = 10_000   # 缓存多少个 (问题, 候选) 的分数
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")  # 英文按词、中文和符号按字
+
+
+def _bigrams(text: str) -> set:
+    """词面打分用的特征：相邻两个 token 组成的二元组，外加单个 token"""
+    tokens = _TOKEN_RE.findall(text.lower())
+    return set(tokens) | {a + b for a, b in zip(tokens, tokens[1:])}
+
+
+def lexical_score(question: str, doc) -> float:
+    """
+    不依赖模型的词面相关度：问题的特征有多大比例出现在候选里，
+    候选问题上的命中权重高于答案
+    """
+    query = _bigrams(question)
+    if not query:
+        return 0.0
+    in_question = len(query & _bigrams(doc.question)) / len(query)
+    in_answer = len(query & _bigrams(doc.answer)) / len(query)
+    return 0.7 * in_question + 0.3 * in_answer
+
+
+class Reranker:
+    """
+    召回结果的重排序器
+
+    有 sentence-transformers 时用本地交叉编码器对 (问题, 候选问答) 成对打分，
+    按 batch_size 分批推理；否则用 lexical_score 词面打分。
+    分数按 (后端, 问题, 候选) 的哈希缓存，重复的问题不再推理。
+    模型推理受 time_budget_ms 限制：一批推理开始后没法中途打断，所以按之前测得的单对耗时
+    把每一批缩到剩余预算放得下的大小（还没测过时先只打一对），预算用完后剩下的候选不再打分，
+    保持原来的向量召回顺序排在已打分的候选之后。
+
+    Args:
+        backend (str): auto / cross / lexical
+        model_name (str): 交叉编码器模型名或本地路径
+        batch_size (int): 每批推理的对数
+        time_budget_ms (float): 单次重排的时间上限，None 表示不限制
+        cache_size (int): 分数缓存的容量
+    """
+
+    def __init__(self, backend: str = RERANK_BACKEND, model_name: str = RERANK_MODEL,
+                 batch_size: int = RERANK_BATCH_SIZE, time_budget_ms: float = RERANK_TIME_BUDGET_MS,
+                 cache_size: int = RERANK_CACHE_SIZE):
+        self.batch_size = batch_size
+        self.time_budget_ms = time_budget_ms
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self._pair_ms = None                 # 单对 (问题, 候选) 推理耗时的滑动平均，用来估算一批的耗时
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.model = self._load_model(backend, model_name)
+        self.backend = "cross" if self.model is not None else "lexical"
+
+    @staticmethod
+    def _load_model(backend: str, model_name: str):
+        if backend == "lexical":
+            return None
+        if CrossEncoder is None:
+            if backend == "cross":
+                raise ImportError("RERANK_BACKEND=cross 需要安装 sentence-transformers")
+            print("⚠️ 未安装 sentence-transformers，重排改用词面打分")
+            return None
+        try:
+            return CrossEncoder(model_name, max_length=RERANK_MAX_LENGTH, device="cpu")
+        except Exception as e:
+            if backend == "cross":
+                raise
+            print(f"⚠️ 重排模型 {model_name} 加载失败，改用词面打分: {e}")
+            return None
+
+    @staticmethod
+    def _doc_text(doc) -> str:
+        return f"{doc.question}\n{doc.answer}"
+
+    def _key(self, question: str, text: str) -> str:
+        return hashlib.sha1(f"{self.backend}\x00{question}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str):
+        with self._lock:
+            score = self._cache.get(key)
+            if score is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(key)
+            return score
+
+    def _cache_put(self, key: str, score: float):
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def score(self, question: str, docs: list) -> list:
+        """
+        给每个候选打分
+
+        Returns:
+            list[float | None]: 与 docs 一一对应；超出时间预算没来得及打分的位置为 None
+        """
+        keys = [self._key(question, self._doc_text(doc)) for doc in docs]
+        scores = [self._cache_get(key) for key in keys]
+        missing = [i for i, s in enumerate(scores) if s is None]
+        if not missing:
+            return scores
+
+        if self.model is None:
+            for i in missing:
+                scores[i] = lexical_score(question, docs[i])
+                self._cache_put(keys[i], scores[i])
+            return scores
+
+        # 候选按召回顺序分批推理，越靠前的越先打分；每批的大小不超过剩余预算能容纳的对数
+        start = time.perf_counter()
+        pos = 0
+        while pos < len(missing):
+            size = self.batch_size
+            if self.time_budget_ms is not None:
+                remaining = self.time_budget_ms - (time.perf_counter() - start) * 1000
+                if self._pair_ms is not None:
+                    size = min(size, int(remaining / self._pair_ms))
+                else:
+                    size = 1  # 还不知道单对耗时，先打一对试探
+                if remaining <= 0 or size <= 0:
+                    self.timeouts += 1
+                    break
+            batch = missing[pos:pos + size]
+            pairs = [(question, self._doc_text(docs[i])) for i in batch]
+            batch_start = time.perf_counter()
+            predicted = self.model.predict(pairs, batch_size=self.batch_size)
+            pair_ms = (time.perf_counter() - batch_start) * 1000 / len(batch)
+            self._pair_ms = pair_ms if self._pair_ms is None else 0.8 * self._pair_ms + 0.2 * pair_ms
+            for i, s in zip(batch, predicted):
+                scores[i] = float(s)
+                self._cache_put(keys[i], scores[i])
+            pos += len(batch)
+        return scores
+
+    def rerank(self, question: str, docs: list, top_n: int = RERANK_TOP_N) -> list:
+        """
+        按重排分数从高到低返回前 top_n 个候选，每个候选附带 rerank_score 属性；
+        未打分的候选（超时）按原顺序排在最后，rerank_score 为 None
+        """
+        if not docs:
+            return []
+        scores = self.score(question, docs)
+        scored = sorted((i for i, s in enumerate(scores) if s is not None), key=lambda i: -scores[i])
+        unscored = [i for i, s in enumerate(scores) if s is None]
+        ranked = []
+        for i in (scored + unscored)[:top_n]:
+            docs[i].rerank_score = scores[i]
+            ranked.append(docs[i])
+        return ranked
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "timeouts": self.timeouts,
+            "entries": len(self._cache),
+        }
+
+
+_reranker = None
+
+
+def get_reranker() -> Reranker:
+    """进程内共享的重排序器，模型只加载一次"""
+    global _reranker
+    if _reranker is None:
+        _reranker = Reranker()
+    return _reranker
+
+
+if __name__ == "__main__":
+    from types import SimpleNamespace
+
+    candidates = [
+        SimpleNamespace(question="怎么查看退款是否成功？", answer="退款会在一个工作日之内到美团账户余额。"),
+        SimpleNamespace(question="在线支付取消订单后钱怎么返还？", answer="订单取消后，款项会在一个工作日内返还到您的美团账户余额。"),
+        SimpleNamespace(question="为什么会出现无法下单的情况？", answer="菜品售完或餐厅不在营业时间。"),
+    ]
+    reranker = get_reranker()
+    for query in ["取消订单后钱什么时候退回", "取消订单后钱什么时候退回"]:
+        start = time.perf_counter()
+        top = reranker.rerank(query, list(candidates), top_n=2)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"🔎 {query}（{elapsed:.1f}ms）")
+        for doc in top:
+            # 超出时间预算没来得及打分的候选 rerank_score 为 None
+            score = "  未打分" if doc.rerank_score is None else f"{doc.rerank_score:.4f}"
+            print(f"   {score}  {doc.question}")
+    print(f"📊 {reranker.stats()}")
@@ -0,0 +1,401 @@
+# 异步问答服务：单进程用 asyncio 同时处理大量问题，对外提供本地 HTTP 接口
+import os
+import json
+import time
+import asyncio
+from collections import deque
+import numpy as np
+import redis.asyncio as aioredis
+from aiohttp import web, ClientError, ClientSession, ClientTimeout, TCPConnector
+from redis.commands.search.query import Query
+from embedding_cache import get_cache
+from answer_cache import SemanticCache
+from local_search import get_local_index
+from quantize import get_pq_index
+from rerank import get_reranker, RERANK_RETRIEVE_K, RERANK_TOP_N
+from Embedding_model import EMBED_MODEL, INDEX_VERSION_KEY, encode_vector, project_vectors
+from llm import (
+    INDEX_NAME, TOP_K, SEARCH_BACKEND, RERANK_ENABLED, LLM_MODEL, SYSTEM_PROMPT, MAX_TOKENS, TEMPERATURE,
+    redis_client, build_prompt, stream_metrics
+)
+
+# ========== 配置 ==========
+HOST = os.getenv("RAG_SERVICE_HOST", "127.0.0.1")
+PORT = int(os.getenv("RAG_SERVICE_PORT", "8080"))
+MAX_CONCURRENCY = int(os.getenv("RAG_MAX_CONCURRENCY", "256"))  # 同时在处理的问题上限
+REQUEST_TIMEOUT = 60  # 单次调用 DashScope 的超时（秒）
+METRICS_WINDOW = 1000  # /health 统计最近多少次流式请求的延迟
+# top_k 指最终送进 prompt 的条数：开启重排时默认只送重排后最好的 RERANK_TOP_N 条
+DEFAULT_TOP_K = RERANK_TOP_N if RERANK_ENABLED else TOP_K
+# 调用 DashScope 可能出现的错误：非 200 响应、连接失败、超时，都算上游错误
+UPSTREAM_ERRORS = (RuntimeError, ClientError, asyncio.TimeoutError)
+
+DASHSCOPE_BASE = "https://dashscope.aliyuncs.com/api/v1/services"
+EMBEDDING_URL = f"{DASHSCOPE_BASE}/embeddings/multimodal-embedding/multimodal-embedding"
+GENERATION_URL = f"{DASHSCOPE_BASE}/aigc/text-generation/generation"
+
+
+async def _read_body(resp) -> dict:
+    """读取 DashScope 的 JSON 响应，网关返回 HTML 等无法解析的内容时同样按上游错误处理"""
+    try:
+        return await resp.json(content_type=None)
+    except ValueError:
+        raise RuntimeError(f"❌ DashScope 返回了无法解析的响应: HTTP {resp.status}")
+
+
+async def _post_json(session: ClientSession, url: str, payload: dict) -> dict:
+    """调用 DashScope HTTP 接口，非 200 时抛出和同步版本一致的 RuntimeError"""
+    headers = {"Authorization": f"Bearer {os.getenv('DASHSCOPE_API_KEY')}"}
+    async with session.post(url, json=payload, headers=headers) as resp:
+        body = await _read_body(resp)
+        if resp.status != 200:
+            raise RuntimeError(f"❌ DashScope 调用失败: {body.get('code')}, {body.get('message')}")
+        return body
+
+
+async def embed_question_async(session: ClientSession, question: str) -> np.ndarray:
+    """异步生成问题向量，先查共享的向量缓存；缓存是 SQLite，读写放到线程里，不阻塞事件循环"""
+    cache = get_cache()
+    cached = (await asyncio.to_thread(cache.get_many, EMBED_MODEL, [question]))[0]
+    if cached is not None:
+        return cached
+    body = await _post_json(session, EMBEDDING_URL, {
+        "model": EMBED_MODEL,
+        "input": {"contents": [{"text": question}]}
+    })
+    vector = np.asarray(body["output"]["embeddings"][0]["embedding"], dtype=np.float32)
+    await asyncio.to_thread(cache.put_many, EMBED_MODEL, [question], [vector])
+    return vector
+
+
+def _search_in_memory(q_vector: np.ndarray, top_k: int) -> list:
+    """本地 / PQ 后端：首次调用要用同步 Redis 客户端加载索引，之后是 NumPy 计算，都在线程里执行"""
+    if SEARCH_BACKEND == "local":
+        return get_local_index(redis_client).search(q_vector, top_k)
+    return get_pq_index(redis_client).search(q_vector, top_k)
+
+
+async def search_faq_async(redis_conn, q_vector: np.ndarray, top_k: int = TOP_K) -> list:
+    """异步 KNN 检索；涉及同步 Redis 客户端和 NumPy 计算的部分放到线程里"""
+    # 答案缓存用的是原始向量，检索前才投影到索引维度；投影矩阵第一次要从 Redis 读取
+    q_vector = (await asyncio.to_thread(project_vectors, [q_vector]))[0]
+    if SEARCH_BACKEND in ("local", "pq"):
+        return await asyncio.to_thread(_search_in_memory, q_vector, top_k)
+    query = (
+        Query(f"*=>[KNN {top_k} @embedding $vec AS score]")
+        .sort_by("score")
+        .return_fields("question", "answer", "source", "category", "crawl_time", "score")
+        .dialect(2)
+    )
+    results = await redis_conn.ft(INDEX_NAME).search(query, query_params={"vec": encode_vector(q_vector)})
+    return results.docs
+
+
+def _rerank(question: str, docs: list, top_n: int) -> list:
+    """重排是 CPU 计算（首次调用还要加载模型），在线程里执行"""
+    return get_reranker().rerank(question, docs, top_n=top_n)
+
+
+async def retrieve_docs(redis_conn, question: str, q_vector: np.ndarray, top_k: int) -> list:
+    """
+    检索送进 prompt 的文档：开启重排时先召回 RERANK_RETRIEVE_K 条候选，
+    重排后只保留最好的 top_k 条；未开启时直接返回 KNN 的前 top_k 条
+    """
+    if not RERANK_ENABLED:
+        return await search_faq_async(redis_conn, q_vector, top_k)
+    docs = await search_faq_async(redis_conn, q_vector, max(top_k, RERANK_RETRIEVE_K))
+    return await asyncio.to_thread(_rerank, question, docs, top_k)
+
+
+async def ask_llm_async(session: ClientSession, prompt: str) -> str:
+    """异步调用大模型生成回答"""
+    body = await _post_json(session, GENERATION_URL, {
+        "model": LLM_MODEL,
+        "input": {"messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]},
+        "parameters": {
+            "result_format": "message",
+            "max_tokens": MAX_TOKENS,
+            "temperature": TEMPERATURE
+        }
+    })
+    return body["output"]["choices"][0]["message"]["content"].strip()
+
+
+async def ask_llm_stream_async(session: ClientSession, prompt: str, stats: dict):
+    """
+    异步流式生成：解析 DashScope 的 SSE 响应，逐段 yield 新增文本，
+    结束后把 ttft_ms / total_ms / output_tokens / tokens_per_s 写进 stats
+    """
+    headers = {
+        "Authorization": f"Bearer {os.getenv('DASHSCOPE_API_KEY')}",
+        "X-DashScope-SSE": "enable",
+    }
+    payload = {
+        "model": LLM_MODEL,
+        "input": {"messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]},
+        "parameters": {
+            "result_format": "message",
+            "incremental_output": True,
+            "max_tokens": MAX_TOKENS,
+            "temperature": TEMPERATURE
+        }
+    }
+    start = time.perf_counter()
+    first_token_at = None
+    chunks = 0
+    output_tokens = None
+    async with session.post(GENERATION_URL, json=payload, headers=headers) as resp:
+        if resp.status != 200:
+            body = await _read_body(resp)
+            raise RuntimeError(f"❌ DashScope 调用失败: {body.get('code')}, {body.get('message')}")
+        # SSE 按行传输，只关心 data: 开头的行
+        async for raw_line in resp.content:
+            line = raw_line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            try:
+                event = json.loads(line[len("data:"):])
+            except ValueError:
+                raise RuntimeError(f"❌ DashScope 返回了无法解析的流式数据: {line[:100]}")
+            # 生成中途出错时，DashScope 在流里推送带 code / message 的事件，而不是 output
+            if event.get("code") or "output" not in event:
+                raise RuntimeError(f"❌ DashScope 调用失败: {event.get('code')}, {event.get('message')}")
+            output_tokens = event.get("usage", {}).get("output_tokens", output_tokens)
+            delta = event["output"]["choices"][0]["message"]["content"]
+            if not delta:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            chunks += 1
+            yield delta
+    stats.update(stream_metrics(start, first_token_at, time.perf_counter(), output_tokens or chunks))
+
+
+async def answer_question(app: web.Application, question: str, top_k: int = DEFAULT_TOP_K) -> dict:
+    """
+    完整的问答流程：向量化 → 检索 → 拼 prompt → 生成，
+    整个过程受信号量限制，超出 MAX_CONCURRENCY 的请求排队等待
+    """
+    async with app["semaphore"]:
+        app["stats"]["in_flight"] += 1
+        try:
+            result = await _answer(app, question, top_k)
+            app["stats"]["served"] += 1  # 只统计成功返回的请求
+            return result
+        finally:
+            app["stats"]["in_flight"] -= 1
+
+
+async def _answer(app: web.Application, question: str, top_k: int) -> dict:
+    """answer_question 的实际实现，先查语义缓存，未命中再走检索和生成"""
+    start = time.perf_counter()
+    answer_cache = app["answer_cache"]
+    answer_cache.sync_version(await app["redis"].get(INDEX_VERSION_KEY))
+
+    q_vector = await embed_question_async(app["http"], question)
+    cached = answer_cache.get(q_vector)
+    if cached is not None:
+        return {
+            "answer": cached["answer"],
+            "cached": True,
+            "docs": [],
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    docs = await retrieve_docs(app["redis"], question, q_vector, top_k)
+    if not docs:
+        answer = "未找到相关信息"
+    else:
+        answer = await ask_llm_async(app["http"], build_prompt(question, docs, top_k))
+        answer_cache.put(q_vector, question, answer, [doc.id for doc in docs])
+    return {
+        "answer": answer,
+        "cached": False,
+        "docs": [
+            {"id": doc.id, "question": doc.question, "score": float(doc.score),
+             "rerank_score": getattr(doc, "rerank_score", None)}
+            for doc in docs
+        ],
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+async def _parse_question(request: web.Request) -> tuple:
+    """
+    解析请求体 {"question": "...", "top_k": 3}
+
+    返回:
+        tuple: (question, top_k)；请求体不合法时抛出 ValueError，由调用方返回 400
+    """
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise ValueError("请求体不是合法的 JSON")
+    if not isinstance(payload, dict):
+        raise ValueError("请求体必须是 JSON 对象")
+    question = str(payload.get("question") or "").strip()
+    if not question:
+        raise ValueError("question 不能为空")
+    try:
+        top_k = int(payload.get("top_k", DEFAULT_TOP_K))
+    except (TypeError, ValueError):
+        raise ValueError("top_k 必须是整数")
+    if top_k <= 0:
+        raise ValueError("top_k 必须大于 0")
+    return question, top_k
+
+
+def _upstream_error(error: Exception) -> tuple:
+    """上游（DashScope）错误转成 (状态码, 错误信息)：超时返回 504，其余调用失败返回 502"""
+    if isinstance(error, asyncio.TimeoutError):
+        return 504, "❌ DashScope 调用超时"
+    if isinstance(error, ClientError):
+        return 502, f"❌ DashScope 连接失败: {error}"
+    return 502, str(error)
+
+
+async def handle_ask(request: web.Request) -> web.Response:
+    """POST /ask  {"question": "...", "top_k": 3}"""
+    try:
+        question, top_k = await _parse_question(request)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400, dumps=_dumps)
+    try:
+        result = await answer_question(request.app, question, top_k)
+    except UPSTREAM_ERRORS as e:
+        status, message = _upstream_error(e)
+        return web.json_response({"error": message}, status=status, dumps=_dumps)
+    return web.json_response(result, dumps=_dumps)
+
+
+async def handle_ask_stream(request: web.Request) -> web.StreamResponse:
+    """
+    POST /ask/stream  {"question": "...", "top_k": 3}
+    以 SSE 返回：每段文本一个 data 事件，结束时发送 done 事件携带延迟指标
+    """
+    try:
+        question, top_k = await _parse_question(request)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400, dumps=_dumps)
+    app = request.app
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    async def send(data: dict, event: str = None):
+        prefix = f"event: {event}\n" if event else ""
+        await response.write(f"{prefix}data: {_dumps(data)}\n\n".encode("utf-8"))
+
+    async with app["semaphore"]:
+        app["stats"]["in_flight"] += 1
+        start = time.perf_counter()
+        try:
+            q_vector = await embed_question_async(app["http"], question)
+            docs = await retrieve_docs(app["redis"], question, q_vector, top_k)
+            retrieval_ms = round((time.perf_counter() - start) * 1000, 1)
+            if not docs:
+                await send({"token": "未找到相关信息"})
+                await send({"retrieval_ms": retrieval_ms}, event="done")
+                app["stats"]["served"] += 1
+                return response
+
+            stats = {}
+            async for delta in ask_llm_stream_async(app["http"], build_prompt(question, docs, top_k), stats):
+                await send({"token": delta})
+            # 端到端的首 token 延迟 = 检索耗时 + 大模型首 token 耗时
+            stats["retrieval_ms"] = retrieval_ms
+            stats["e2e_ttft_ms"] = round(retrieval_ms + stats["ttft_ms"], 1)
+            app["stream_metrics"].append(stats)
+            await send(stats, event="done")
+            app["stats"]["served"] += 1  # 只统计成功返回的请求
+        except UPSTREAM_ERRORS as e:
+            # 响应头已经发出，只能用 error 事件告诉客户端上游失败
+            status, message = _upstream_error(e)
+            await send({"error": message, "status": status}, event="error")
+        finally:
+            app["stats"]["in_flight"] -= 1
+    return response
+
+
+def _percentile(values: list, p: float) -> float:
+    return round(float(np.percentile(values, p)), 1) if values else 0.0
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    """GET /health：返回当前排队情况和缓存命中率"""
+    app = request.app
+    return web.json_response({
+        "in_flight": app["stats"]["in_flight"],
+        "served": app["stats"]["served"],
+        "embedding_cache": await asyncio.to_thread(get_cache().stats),
+        "answer_cache": app["answer_cache"].stats(),
+        "stream": {
+            "requests": len(app["stream_metrics"]),
+            "p50_e2e_ttft_ms": _percentile([m["e2e_ttft_ms"] for m in app["stream_metrics"]], 50),
+            "p95_e2e_ttft_ms": _percentile([m["e2e_ttft_ms"] for m in app["stream_metrics"]], 95),
+            "p50_total_ms": _percentile([m["total_ms"] for m in app["stream_metrics"]], 50),
+            "p50_tokens_per_s": _percentile([m["tokens_per_s"] for m in app["stream_metrics"]], 50),
+        },
+    })
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False)
+
+
+async def on_startup(app: web.Application):
+    # 重排模型在启动时加载好，第一个请求不用等
+    if RERANK_ENABLED:
+        await asyncio.to_thread(get_reranker)
+    # 所有请求共用一个 HTTP 连接池和一个 Redis 连接池
+    app["http"] = ClientSession(
+        connector=TCPConnector(limit=MAX_CONCURRENCY),
+        timeout=ClientTimeout(total=REQUEST_TIMEOUT)
+    )
+    app["redis"] = aioredis.Redis(
+        connection_pool=aioredis.ConnectionPool(
+            host="localhost", port=6379, max_connections=MAX_CONCURRENCY, decode_responses=False
+        )
+    )
+
+
+async def on_cleanup(app: web.Application):
+    await app["http"].close()
+    await app["redis"].aclose()
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app["semaphore"] = asyncio.Semaphore(MAX_CONCURRENCY)
+    app["stats"] = {"in_flight": 0, "served": 0}
+    app["stream_metrics"] = deque(maxlen=METRICS_WINDOW)
+    app["answer_cache"] = SemanticCache()
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post("/ask", handle_ask)
+    app.router.add_post("/ask/stream", handle_ask_stream)
+    app.router.add_get("/health", handle_health)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=HOST, port=PORT)
+
+"""
+$ curl -s -X POST http://127.0.0.1:8080/ask -d '{"question": "为什么会出现无法下单的情况"}'
+{"answer": "无法下单可能是由于菜品售完、餐厅不在营业时间等原因……", "cached": false, "docs": [...], "latency_ms": 1234.5}
+
+$ curl -N -X POST http://127.0.0.1:8080/ask/stream -d '{"question": "为什么会出现无法下单的情况"}'
+data: {"token": "无法下单"}
+
+data: {"token": "可能是由于菜品售完"}
+...
+event: done
+data: {"ttft_ms": 398.2, "total_ms": 1187.4, "output_tokens": 31, "tokens_per_s": 39.3, "retrieval_ms": 85.6, "e2e_ttft_ms": 483.8}
+"""
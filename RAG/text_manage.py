@@ -1,8 +1,44 @@
 # 文档处理：文本清洗、分段切分、原数据标注等
+import os
 import re
+import sys
 import json
+import time
 from pathlib import Path
-from datatime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterable, Iterator
+
+# 预编译正则，逐行处理时不用每次重新解析
+_TAG_RE = re.compile(r"<.*?>")            # HTML 标签（不跨行，和原先整段替换的效果一致）
+_MARKER_RE = re.compile(r"([QA])[:：]\s*")  # 行首的 Q:/Q：（问题）或 A:/A：（答案）标记
+# 分类标题：不带标点的短句，以“问题/相关/说明”等结尾，例如“在线支付问题”
+_SECTION_RE = re.compile(r"[^。！？!?；;，,：:、]{1,20}(?:问题|相关|说明|指南|须知|帮助|介绍)")
+_SECTION_TAILS = frozenset("题关明南知助绍")  # 标题的最后一个字，先用它廉价过滤再跑正则
+
+SHARD_SIZE = 50_000                   # 目录处理时每个 JSONL 分片最多写多少条 FAQ
+CRAWL_STATE_FILE = "crawl_state.json" # crawler.py 记录的 URL → 抓取文件 映射，用来给每个文件标注来源
+
+def clean_line(line: str) -> str:
+    """清洗单行：去掉 HTML 标签和首尾空白；没有 < 的行跳过正则"""
+    if "<" in line:
+        line = _TAG_RE.sub("", line)
+    return line.strip()
+
+def iter_clean_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    流式清洗：逐行去标签、去空白并跳过空行，不需要把整个文件读进内存。
+
+    参数:
+        lines (Iterable[str]): 原始文本行，可以直接传入打开的文件对象。
+
+    返回:
+        Iterator[str]: 清洗后的非空行。
+    """
+    for line in lines:
+        line = clean_line(line)
+        if line:
+            yield line
 
 def clean_text(text: str) -> str:
     """
@@ -14,12 +50,72 @@ def clean_text(text: str) -> str:
     返回:
         str: 清洗后的文本内容。
     """
-    # 去掉 HTML 标签（如果有残留）
-    text = re.sub(r"<.*?>", "", text)
-    # 去掉多余空格并过滤空行
-    lines = [line.strip() for line in text.aplitlines() if lines.strip()]
-    return "\n".join(lines)
+    return "\n".join(iter_clean_lines(text.splitlines()))
+
+def iter_faq(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    单遍状态机解析 FAQ：逐行清洗并识别 Q/A 标记和分类标题，每凑齐一条问答就产出。
+    内存里只保留当前这一条问答，也不生成中间的整段字符串。
 
+    规则：
+        - Q: 开头的行开始一条新问答，A: 开头的行（可选）开始答案；
+        - 第一个 Q 之前的文字是分类标题；
+        - 答案之后、下一个 Q 之前，形如“xx问题/xx说明”的不带标点短句也当作分类标题，
+          不再并进上一条答案，也不再像原来那样变成一条空答案的记录；
+        - 问题写在 Q: 下一行时，下一行就是问题。
+
+    参数:
+        lines (Iterable[str]): 原始文本行（可以未清洗），例如打开的文件对象。
+
+    返回:
+        Iterator[dict]: 包含'question'、'answer'和'section'（所属分类标题，可能为 None）键的字典。
+    """
+    section = None        # 当前分类标题
+    question = None       # 当前问题；None 表示还没遇到 Q
+    answer = []           # 当前答案的各行
+    pending = None        # 答案后面一行可能是下一节的标题，先暂存，看下一行再决定
+    tag_sub = _TAG_RE.sub
+    for line in lines:
+        # 与 clean_line 相同，内联以省掉每行一次函数调用
+        line = line.strip()
+        if not line:
+            continue
+        if "<" in line:
+            line = tag_sub("", line).strip()
+            if not line:
+                continue
+        # 绝大多数行不以 Q/A 开头，先比较首字符，省掉一次正则匹配
+        marker = _MARKER_RE.match(line) if line[0] in "QA" else None
+        kind = marker.group(1) if marker else None
+        text = line[marker.end():] if marker else line
+
+        if kind == "Q":
+            if question:
+                yield {"question": question, "answer": "\n".join(answer), "section": section}
+            if pending is not None:
+                section = pending      # 紧跟着 Q 出现，确认是下一节的分类标题
+                pending = None
+            question, answer = text, []
+            continue
+
+        if pending is not None:
+            answer.append(pending)     # 后面不是 Q，说明是答案的一部分
+            pending = None
+        if question is None:
+            section = text             # 第一个 Q 之前：分类标题
+        elif not question:
+            question = text            # Q: 后换行才写的问题
+        elif kind == "A" or not answer:
+            if text:
+                answer.append(text)
+        elif text[-1] in _SECTION_TAILS and _SECTION_RE.fullmatch(text):
+            pending = text
+        else:
+            answer.append(text)
+    if pending is not None:
+        answer.append(pending)
+    if question:
+        yield {"question": question, "answer": "\n".join(answer), "section": section}
 
 def split_faq(text: str):
     """
@@ -27,96 +123,170 @@ def split_faq(text: str):
 
     参数：
         text(str): 包含FAQ内容的文本字符串
-    
+
     返回：
-        list[dict]: 每个元素是一个包含'question'和'answer'键的字典列表
+        list[dict]: 每个元素是一个包含'question'、'answer'和'section'键的字典列表
     """
-    # 按Q:  或Q: 分割文本
-    parts = re.split(r"(?:^|\n)Q[:：]", text) # 找到Q开头的地方
-    # 切完后 parts 大概长这样：['', '问题1\n答案1\n\n', '问题2\n答案2\n\n', '问题3\n答案3']
-    qa_pairs = [] # 装结果列表
-    for part in parts:
-        part = part.strip() # 去掉首尾空白、换行
-        if not part:
-            continue
-        # 将第一行当问题，其余部分作为答案
-        lines = part.splitlines() # 按行切，返回列表
-        question = lines[0] # 固定当问题
-        answer = "\n".join(lines[1:]) if len(lines) > 1 else "" # 答案
-        qa_pairs.append({
-            "question": question,
-            "answer": answer
-        }) # 装进列表
-        return qa_pairs
-
-def process_faq(input_file: str, output_file: str, source_url: str, category="FAQ"):
+    return list(iter_faq(text.splitlines()))
+
+def process_faq(input_file: str, output_file: str, source_url: str, category="FAQ") -> int:
     """
-    处理FAQ文本文件，清洗、分割并添加元数据后保存为JSON格式。
+    处理FAQ文本文件，清洗、分割并添加元数据后逐条写成 JSON Lines（每行一条 FAQ）。
+    输入逐行读取、由 iter_faq 单遍解析、结果逐行写出，内存占用与文件大小无关。
 
     参数:
         input_file (str): 输入的原始FAQ文本文件路径。
-        output_file (str): 输出处理后的JSON文件路径。
+        output_file (str): 输出的 JSONL 文件路径。
         source_url (str): 数据来源URL。
         category (str): FAQ分类，默认为"FAQ"。
 
     返回:
-        None
+        int: 写出的 FAQ 条数。
     """
-    # 读文件读成str,清洗拆分
-    raw_text = Path(input_file).read_text(encoding="utf-8")
-    cleaned_text = clean_text(raw_text)
-    qa_pairs = split_faq(cleaned_text)
     # 生成UTC时间戳
     now = datetime.now(timezone.utc).isoformat()
+    count = 0
+    with open(input_file, "r", encoding="utf-8") as fin, open(output_file, "w", encoding="utf-8") as fout:
+        # 给每条问答挂元数据，生成一条写一条
+        for qa in iter_faq(fin):
+            fout.write(_faq_record(qa, source_url, category, now))
+            count += 1
+    print(f"✅ 已处理 {count} 条 FAQ，结果保存到 {output_file}")
+    return count
+
+def _faq_record(qa: dict, source_url: str, category: str, now: str) -> str:
+    """一条问答加上元数据，序列化成 JSONL 的一行"""
+    return json.dumps({
+        "question": qa["question"],
+        "answer": qa["answer"],
+        "metadata": {
+            "source": source_url,
+            "category": category,
+            "section": qa["section"],
+            "crawl_time": now
+        }
+    }, ensure_ascii = False) + "\n"
+
+def _process_file(task: tuple) -> list[str]:
+    """子进程里处理一个文件，直接返回序列化好的 JSONL 行，主进程只需按顺序写出"""
+    path, source_url, category, now = task
+    with open(path, "r", encoding="utf-8") as f:
+        return [_faq_record(qa, source_url, category, now) for qa in iter_faq(f)]
+
+def _load_sources(state_file: str) -> dict:
+    """从爬虫状态文件得到 抓取文件名 → URL，没有状态文件就返回空"""
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    return {os.path.basename(item["file"]): url for url, item in state.items() if item.get("file")}
+
+def process_faq_dir(
+    input_dir: str,
+    output_dir: str,
+    category: str = "FAQ",
+    pattern: str = "*.txt",
+    workers: int = None,
+    shard_size: int = SHARD_SIZE,
+    state_file: str = CRAWL_STATE_FILE
+) -> dict:
+    """
+    目录级批量处理：把 input_dir 下所有爬取文件分发到多个进程并行清洗、切分，
+    结果按文件名顺序合并写入 output_dir/part-00000.jsonl、part-00001.jsonl……
 
-    # 给每条问答挂元数据
-    processed = []
-    for qa in qa_pairs:
-        processed.append({
-            "question": qa["question"],
-            "answer": qa["answer"],
-            "metadata": {
-                "source": source_url,
-                "category": category,
-                "crawl_time": now
-            }
-        })
-    # 写JSON文件
-    Path(output_file).write_text(
-        # Python对象->JSON字符串，缩进两个空格
-        json.dumps(processed, ensure_ascii = False, indent = 2),
-        encoding = "utf-8"
-    )
-    print(f"✅ 已处理 {len(processed)} 条 FAQ，结果保存到 {output_file}")
+    文件按路径排序后提交，executor.map 按提交顺序返回结果，
+    因此无论几个进程、谁先跑完，输出内容和分片边界都完全一致。
+    每条 FAQ 的 source 取自爬虫状态文件里该文件对应的 URL，找不到时用文件路径。
+
+    参数:
+        input_dir (str): 爬取结果目录，例如 crawler.py 的 faq_pages。
+        output_dir (str): 分片 JSONL 输出目录。
+        category (str): FAQ分类，默认为"FAQ"。
+        pattern (str): 要处理的文件名模式。
+        workers (int): 进程数，默认等于 CPU 核数。
+        shard_size (int): 每个分片最多的 FAQ 条数。
+        state_file (str): 爬虫状态文件路径。
+
+    返回:
+        dict: files、records、shards 数量与耗时。
+    """
+    start = time.perf_counter()
+    files = sorted(str(path) for path in Path(input_dir).rglob(pattern) if path.is_file())
+    sources = _load_sources(state_file)
+    now = datetime.now(timezone.utc).isoformat()
+    tasks = [(path, sources.get(os.path.basename(path), path), category, now) for path in files]
+
+    os.makedirs(output_dir, exist_ok = True)
+    # 清掉上次运行遗留的分片，避免新旧分片混在一起
+    for old in Path(output_dir).glob("part-*.jsonl"):
+        old.unlink()
+
+    workers = workers or os.cpu_count() or 1
+    # 每次给子进程派一小批文件，减少进程间通信次数
+    chunksize = max(1, len(tasks) // (workers * 8))
+    records = shards = in_shard = 0
+    fout = None
+    report_every = max(1, len(tasks) // 20)
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        for done, lines in enumerate(executor.map(_process_file, tasks, chunksize = chunksize), 1):
+            for line in lines:
+                if fout is None or in_shard >= shard_size:
+                    if fout is not None:
+                        fout.close()
+                    fout = open(os.path.join(output_dir, f"part-{shards:05d}.jsonl"), "w", encoding = "utf-8")
+                    shards += 1
+                    in_shard = 0
+                fout.write(line)
+                in_shard += 1
+            records += len(lines)
+            if done % report_every == 0 or done == len(tasks):
+                elapsed = time.perf_counter() - start
+                print(f"⏳ [{done}/{len(tasks)}] {records} 条 FAQ，{done / elapsed:.1f} files/s")
+    if fout is not None:
+        fout.close()
+
+    summary = {
+        "files": len(tasks),
+        "records": records,
+        "shards": shards,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+    print(f"✅ 已处理 {summary['files']} 个文件、{records} 条 FAQ，写入 {output_dir} 下 {shards} 个分片")
+    return summary
+
+def iter_faq_docs(file_path: str) -> Iterator[dict]:
+    """
+    惰性读取 process_faq 的输出，一次只解析一行；传入目录时按文件名顺序读取其中所有
+    JSONL 分片（process_faq_dir 的输出）。
+    旧版本产出的整体 JSON 数组（.json）也能读，但需要整体加载。
+    """
+    if Path(file_path).is_dir():
+        for shard in sorted(Path(file_path).glob("*.jsonl")):
+            yield from iter_faq_docs(str(shard))
+        return
+    if Path(file_path).suffix == ".json":
+        with open(file_path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
 
 if __name__ == "__main__":
-    process_faq(
-        imput_file = "faq_text",
-        output_file = "faq_processed.json",
-        source_url = "https://waimai.meituan.com/help/faq",
-        category = "支付问题"
-    )
+    if len(sys.argv) > 1:
+        # 目录模式：python text_manage.py faq_pages [输出目录]
+        process_faq_dir(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "faq_processed", category = "支付问题")
+    else:
+        process_faq(
+            input_file = "faq.txt",
+            output_file = "faq_processed.jsonl",
+            source_url = "https://waimai.meituan.com/help/faq",
+            category = "支付问题"
+        )
 
 """
-# head -n 20 faq_processed.json
-[
-  {
-    "question": "在线支付问题",
-    "answer": "",
-    "metadata": {
-      "source": "https://waimai.meituan.com/help/faq",
-      "category": "支付问题",
-      "crawl_time": "2025-09-04T02:38:28.261319+00:00"
-    }
-  },
-  {
-    "question": "在线支付取消订单后钱怎么返还？",
-    "answer": "订单取消后，款项会在一个工作日内，直接返还到您的美团账户余额。",
-    "metadata": {
-      "source": "https://waimai.meituan.com/help/faq",
-      "category": "支付问题",
-      "crawl_time": "2025-09-04T02:38:28.261319+00:00"
-    }
-  },
-  {
-"""
\ No newline at end of file
+# head -n 2 faq_processed.jsonl
+{"question": "在线支付取消订单后钱怎么返还？", "answer": "订单取消后，款项会在一个工作日内，直接返还到您的美团账户余额。", "metadata": {"source": "https://waimai.meituan.com/help/faq", "category": "支付问题", "section": "在线支付问题", "crawl_time": "2025-09-04T02:38:28.261319+00:00"}}
+{"question": "怎么查看退款是否成功？", "answer": "退款会在一个工作日之内到美团账户余额，可在“账号管理——我的账号”中查看是否到账", "metadata": {"source": "https://waimai.meituan.com/help/faq", "category": "支付问题", "section": "在线支付问题", "crawl_time": "2025-09-04T02:38:28.261319+00:00"}}
+"""